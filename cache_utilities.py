@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""
+Helpers for persisting per-dataset intermediate results on disk.
+Everything lives under CACHE_DIR/<dataset>/, where the dataset is
+the name of the Postgres database the results were computed from.
+"""
+
+import os
+import shutil
+import pickle
+import hashlib
+import tempfile
+
+CACHE_DIR = "cache"
+VERSION_FILE = "VERSION"
+CACHED_DIR = "cached"
+
+def dataset_name(conn):
+    """
+    Returns the name of the database a connection points at.
+
+    :param conn: a Postgres database connection
+    """
+    return conn.get_dsn_parameters()['dbname']
+
+def cache_path(dataset, *parts):
+    """
+    Returns the path of a cache file for the given dataset,
+    creating any missing parent directories.
+
+    :param dataset: name of the dataset
+    :param parts: path components below the dataset directory
+    """
+    path = os.path.join(CACHE_DIR, dataset, *parts)
+    makedirs(os.path.dirname(path))
+    return path
+
+def makedirs(directory):
+    """
+    Creates a directory and its parents unless it already exists.
+
+    :param directory: the directory to create
+    """
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Another process may have created it in the meantime.
+            if not os.path.isdir(directory):
+                raise
+
+def versioned_dir(dataset, name, version):
+    """
+    Returns the path of a cache directory whose contents are only
+    valid for one version of the dataset. If the directory was
+    written against a different version stamp, everything in it
+    is thrown away first.
+
+    :param dataset: name of the dataset
+    :param name: directory name below the dataset directory
+    :param version: the current dataset version stamp
+    """
+    path = cache_path(dataset, name, VERSION_FILE)
+    root = os.path.dirname(path)
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read().strip() == version:
+                return root
+        shutil.rmtree(root, ignore_errors=True)
+        makedirs(root)
+    with open(path, 'w') as f:
+        f.write(version)
+    return root
+
+def cached(dataset, name, version, compute, rebuild = False):
+    """
+    Returns the result of |compute| for a dataset, pickled under a
+    versioned_dir and reused until the dataset version stamp changes.
+
+    :param dataset: name of the dataset
+    :param name: file name of the result
+    :param version: the current dataset version stamp
+    :param compute: function of no arguments computing the result
+    :param rebuild: ignore any saved result and recompute it
+    """
+    path = os.path.join(versioned_dir(dataset, CACHED_DIR, version), name)
+    if not rebuild and os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    result = compute()
+    # Write to a temporary file that is renamed into place, so
+    # concurrent readers never see a partial result.
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, 'wb') as f:
+        pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
+    return result
+
+def dataset_version(cursor):
+    """
+    Returns a stamp that changes whenever posts or users are
+    added to or removed from the dataset. Cached results tagged
+    with an older stamp should be thrown away.
+
+    :param cursor: a Postgres database cursor
+    """
+    cursor.execute("SELECT COUNT(*), MAX(id), MAX(creation_date) FROM Post;")
+    posts = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*), MAX(id), MAX(creation_date) FROM se_user;")
+    users = cursor.fetchone()
+    stamp = "|".join(str(value) for value in posts + users)
+    return hashlib.md5(stamp).hexdigest()
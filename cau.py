@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import requests
+import elo
 from datetime import datetime
 from search_utilities import *
 
@@ -29,6 +30,20 @@ def cau_history(cursor, conn, user_id, end_date = None):
         _create_cau_table(cursor, conn, end_date)
     return _cau_history(cursor, user_id)
 
+def cau_vector(cursor, conn, index, end_date = None):
+    """
+    Returns the CAU score of every user as an array aligned
+    with a UserIndex. Optionally consider only games played
+    up until a given end date.
+
+    :param cursor: a Postgres database cursor
+    :param index: a user_index.UserIndex
+    :param end_date: end_date for CAU calculation.
+    """
+    if not _cau_table_exists(cursor):
+        _create_cau_table(cursor, conn, end_date)
+    return elo.ratings_vector(cursor, 'cau', index, end_date)
+
 ####################################################
 ########### Private helper methods below ###########
 ####################################################
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Average metric curves for a cohort of users, e.g. experts vs.
+nonexperts, sampled at lifetime percentiles.
+
+All users' percentile cutoffs are fetched in one batch and the metric
+is computed through feature_pipeline, so each distinct cutoff needs
+only one graph snapshot, however many users and percentiles map onto
+it. The snapshots are grown from the cached edge list rather than
+rebuilt for every cutoff. Confidence bands are bootstrapped with one
+matrix product over resampling weights, with no per-resample loop.
+"""
+
+from __future__ import division
+import numpy as np
+import metrics
+import feature_pipeline
+from feature_pipeline import FeatureSpec
+
+def metric_matrix(cur, conn, user_ids, metric, samples = None, store = None):
+    """
+    Returns a (users x samples) array with the metric of every user
+    at every lifetime percentile.
+
+    :param cur: a Postgres database cursor
+    :param conn: the connection |cur| belongs to
+    :param user_ids: the cohort
+    :param metric: one of feature_pipeline.METRICS
+    :param samples: lifetime percentiles, defaults to metrics.percentiles
+    :param store: optional feature_store.FeatureStore to read and fill
+    """
+    if not samples:
+        samples = metrics.percentiles
+    user_ids = list(user_ids)
+    matrix = np.zeros((len(user_ids), len(samples)))
+
+    missing = []
+    for row, user_id in enumerate(user_ids):
+        cached = store.get(metric, user_id, samples) if store is not None else None
+        if cached is None:
+            missing.append(row)
+        else:
+            matrix[row] = cached
+
+    if missing:
+        missing_ids = [user_ids[row] for row in missing]
+        fv = feature_pipeline.extract(cur, conn, missing_ids, [FeatureSpec(metric, samples)])
+        for row, user_id, values in zip(missing, missing_ids, fv):
+            matrix[row] = values
+            if store is not None:
+                store.put(metric, user_id, samples, values)
+    return matrix
+
+def bootstrap_band(matrix, resamples = 1000, confidence = .95, seed = 0):
+    """
+    Returns (low, high) bootstrap confidence bounds on the column
+    means of |matrix|, resampling its rows with replacement.
+
+    :param matrix: (users x samples) array
+    :param resamples: number of bootstrap resamples
+    :param confidence: coverage of the band
+    :param seed: seed for the resampling
+    """
+    n = len(matrix)
+    rng = np.random.RandomState(seed)
+    # Row i of weights counts how often each user was drawn in resample i.
+    weights = rng.multinomial(n, np.ones(n) / n, size=resamples)
+    means = weights.dot(matrix) / n
+    tail = (1 - confidence) / 2 * 100
+    return np.percentile(means, tail, axis=0), np.percentile(means, 100 - tail, axis=0)
+
+def cohort_mean(cur, conn, user_ids, metric, samples = None, store = None):
+    """
+    Returns the cohort's average metric at every lifetime
+    percentile, without a confidence band.
+
+    :param cur: a Postgres database cursor
+    :param conn: the connection |cur| belongs to
+    :param user_ids: the cohort
+    :param metric: one of feature_pipeline.METRICS
+    :param samples: lifetime percentiles, defaults to metrics.percentiles
+    :param store: optional feature_store.FeatureStore to read and fill
+    """
+    return metric_matrix(cur, conn, user_ids, metric, samples, store).mean(axis=0)
+
+def cohort_curve(cur, conn, user_ids, metric, samples = None, resamples = 1000,
+                 confidence = .95, store = None):
+    """
+    Returns (mean, low, high) arrays giving the cohort's average
+    metric at every lifetime percentile along with a bootstrap
+    confidence band.
+
+    :param cur: a Postgres database cursor
+    :param conn: the connection |cur| belongs to
+    :param user_ids: the cohort
+    :param metric: one of feature_pipeline.METRICS
+    :param samples: lifetime percentiles, defaults to metrics.percentiles
+    :param resamples: number of bootstrap resamples
+    :param confidence: coverage of the band
+    :param store: optional feature_store.FeatureStore to read and fill
+    """
+    matrix = metric_matrix(cur, conn, user_ids, metric, samples, store)
+    low, high = bootstrap_band(matrix, resamples, confidence)
+    return matrix.mean(axis=0), low, high
@@ -3,10 +3,15 @@
 import psycopg2
 import snap
 import sys
+import numpy as np
 import elo
+import edge_cache
+import edge_weights
+import degrees
+import sliding_window
+import user_index
 import matplotlib.pyplot as plt
 from datetime import date
-from collections import Counter
 
 DB_NAME = "Ben-han"
 DB_USER = "Ben-han"
@@ -36,36 +41,40 @@ def results(cursor):
             break
         yield result
 
-def compute_user_reputations(cur, conn):
+def compute_user_reputations(cur, conn, bins=TIME_BINS):
     """Computes time-based user reputation as the number of upvotes
-       gained from posts made before a certain time. Calculates a user's
-       cumulative reputation according to this metric for each time bin
-       above and saves it to the |upvotes| table."""
-
-    reputation_query = """SELECT SUM(score) FROM Post
-                          WHERE owner_user_id = %(user_id)s
-                          AND creation_date > %(start_date)s
-                          AND creation_date < %(end_date)s;
-                       """
-    insertion_query = """INSERT INTO upvotes VALUES (%(user_id)s, %(r1)s, %(r2)s, %(r3)s, %(r4)s, %(r5)s, %(r6)s);
-                      """
-
-    cur.execute("SELECT id FROM se_user;")
-    user_ids = list(cur)
-    for user_id in user_ids:
-        # Skip dummy users.
-        if user_id < 0:
-            continue
-
-        # Calculate user rep per time bin.
-        rep = []
-        for bin in TIME_BINS:
-            cur.execute(reputation_query, {'user_id': user_id, 'start_date': bin[0], 'end_date': bin[1]})
-            rep.append(cur.fetchone())
-
-        # Insert into 'upvotes' table.
-        cur.execute(insertion_query, {'user_id': user_id, 'r1': rep[0], 'r2': rep[1], 'r3': rep[2], 'r4': rep[3], 'r5': rep[4], 'r6': rep[5]})
-        conn.commit()
+       gained from posts made within each time bin and saves it to
+       the |upvotes| table, one bin<i> column per bin.
+
+       The table is rebuilt with a single INSERT ... SELECT that
+       aggregates every bin at once with conditional sums over one
+       GROUP BY owner pass, so nothing is computed per user."""
+
+    columns = ", ".join("bin{} bigint".format(i + 1) for i in range(len(bins)))
+    aggregates = ",\n                          ".join(
+        "SUM(CASE WHEN p.creation_date > %(start{0})s AND p.creation_date < %(end{0})s "
+        "THEN p.score END)".format(i) for i in range(len(bins)))
+    params = {'first': min(bin[0] for bin in bins), 'last': max(bin[1] for bin in bins)}
+    for i, bin in enumerate(bins):
+        params['start{}'.format(i)] = bin[0]
+        params['end{}'.format(i)] = bin[1]
+
+    rebuild_query = """INSERT INTO upvotes
+                       SELECT u.id,
+                          {}
+                       FROM se_user u
+                       LEFT OUTER JOIN Post p
+                       ON p.owner_user_id = u.id
+                       AND p.creation_date > %(first)s
+                       AND p.creation_date < %(last)s
+                       WHERE u.id >= 0
+                       GROUP BY u.id;
+                    """.format(aggregates)
+
+    cur.execute("DROP TABLE IF EXISTS upvotes;")
+    cur.execute("CREATE TABLE upvotes (id bigint PRIMARY KEY, {});".format(columns))
+    cur.execute(rebuild_query, params)
+    conn.commit()
 
 def foobarbaz(data, start_date, end_date):
     """Extracts ELO data from within a start_date and
@@ -80,7 +89,10 @@ def compute_elo_ratings(cur, conn):
     """Computes the user's elo rating for each time bin
        above and saves it to the |elo| table. JK about computing...
        we're just scraping it from a website. See 
-       http://stackrating.com/"""
+       http://stackrating.com/
+
+       See compute_rating_snapshots for an offline version built
+       from our own elo table."""
 
     insertion_query = """INSERT INTO elo VALUES (%(user_id)s, %(r1)s, %(r2)s, %(r3)s, %(r4)s, %(r5)s, %(r6)s);
                       """
@@ -102,15 +114,81 @@ def compute_elo_ratings(cur, conn):
         cur.execute(insertion_query, {'user_id': user_id, 'r1': rep[0], 'r2': rep[1], 'r3': rep[2], 'r4': rep[3], 'r5': rep[4], 'r6': rep[5]})
         conn.commit()
 
-def add_nodes(cur, graph):
-    """Add users to graph as nodes."""
+def compute_rating_snapshots(cur, conn, bins=TIME_BINS, table='elo'):
+    """Derives every user's rating at the end of each time bin from the
+       locally computed |table| ('elo' or 'cau') and stores it in
+       |table|_snapshot, keyed by (bin, user_id). Bins are numbered
+       from 1 like the upvotes columns. A user's rating in a bin is
+       the latest one recorded up to the bin's end, or 1500 if there
+       is none yet, i.e. the same value elo.elo(cur, conn, user_id,
+       end_date) returns.
+
+       Needs no network access and runs as one window-function
+       query over the whole table instead of per-user lookups."""
+    elo.ensure_tables(cur, conn)
+    snapshot = "{}_snapshot".format(table)
+
+    snapshot_query = """INSERT INTO {snapshot} (bin, user_id, rating)
+                        WITH bins AS (
+                            SELECT bin::int AS bin, end_date
+                            FROM unnest(%(ends)s::timestamp[]) WITH ORDINALITY AS b(end_date, bin)
+                        ), ranked AS (
+                            SELECT b.bin, r.user_id, r.rating,
+                                   row_number() OVER (PARTITION BY b.bin, r.user_id
+                                                      ORDER BY r.time DESC, r.foobarbaz DESC) AS latest
+                            FROM {table} r
+                            INNER JOIN bins b
+                            ON r.time <= b.end_date
+                        )
+                        SELECT b.bin, u.id, COALESCE(ranked.rating, 1500)
+                        FROM se_user u
+                        CROSS JOIN bins b
+                        LEFT OUTER JOIN ranked
+                        ON ranked.bin = b.bin
+                        AND ranked.user_id = u.id
+                        AND ranked.latest = 1
+                        WHERE u.id >= 0;
+                     """.format(snapshot=snapshot, table=table)
+
+    cur.execute("DROP TABLE IF EXISTS {};".format(snapshot))
+    cur.execute("""CREATE TABLE {} (
+                       bin int,
+                       user_id bigint,
+                       rating double precision,
+                       PRIMARY KEY (bin, user_id));
+                """.format(snapshot))
+    cur.execute(snapshot_query, {'ends': [bin[1] for bin in bins]})
+    conn.commit()
+
+def rating_snapshot(cur, bin, table='elo', index=None):
+    """Returns the ratings stored by compute_rating_snapshots for a
+       bin (numbered from 1), as {user_id: rating} or, if a UserIndex
+       is given, as an array aligned with it."""
+    cur.execute("SELECT user_id, rating FROM {}_snapshot WHERE bin = %s;".format(table), (bin,))
+    ratings = dict(results(cur))
+    if index is None:
+        return ratings
+    return index.to_array(ratings, default=1500)
+
+def node_ids(cur, index=None):
+    """Returns the ids of the users that make up a graph's nodes,
+       taken from a UserIndex if one is given and from se_user
+       otherwise."""
+    if index is not None:
+        return index.ids.tolist()
+
     cur.execute("SELECT id FROM se_user;")
-    for row in results(cur):
-        user_id = row[0]
+    # Filter out dummy users with ID < 0.
+    return [row[0] for row in results(cur) if row[0] >= 0]
 
-        # Filter out dummy users with ID < 0.
-        if user_id < 0:
-            continue
+
+def add_nodes(cur, graph, index=None, nodes=None):
+    """Add users to graph as nodes. If a UserIndex is given the
+       node set is taken from it instead of querying se_user, and
+       a list of ids from node_ids can be passed to skip both."""
+    if nodes is None:
+        nodes = node_ids(cur, index)
+    for user_id in nodes:
         graph.AddNode(user_id)
 
 
@@ -126,238 +204,6 @@ def add_nodes_before(cur, graph, cutoff):
         graph.AddNode(user_id)
 
 
-def add_edges(cur, graph):
-    """Add a directed edge between each pair of nodes where the source
-       user answered a question asked by the destination user.
-    """
-
-    query = """SELECT DISTINCT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1
-               INNER JOIN Post t2
-               ON t1.parent_id = t2.id
-               WHERE t1.post_type_id = 2 AND t2.post_type_id = 1;
-            """
-
-    cur.execute(query)
-    for src, dst in results(cur):
-        if src is None or dst is None:
-            continue
-        graph.AddEdge(src, dst)
-
-
-def add_edges_time_slice(cur, graph, start_date, end_date):
-    """Add a directed edge between each pair of nodes where the source
-       user answered a question asked by the destination user.
-    """
-
-    query = """SELECT DISTINCT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1
-               INNER JOIN Post t2
-               ON t1.parent_id = t2.id
-               INNER JOIN se_user u1
-               ON t1.owner_user_id = u1.id
-               INNER JOIN se_user u2
-               ON t2.owner_user_id = u2.id
-               WHERE t1.post_type_id = 2 AND t2.post_type_id = 1
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s
-               AND u1.reputation < u2.reputation;
-            """
-
-    cur.execute(query, {'start_date': start_date, 'end_date': end_date})
-    for src, dst in results(cur):
-        if src is None or dst is None:
-            continue
-        graph.AddEdge(src, dst)
-
-
-def add_edges_answer_question(cur, graph, start_date, end_date, directed, weighted, weights):
-    """Add an edge between each pair of nodes where the source
-       user answered a question asked by the destination user.
-    """
-    if not weighted:
-        query = """SELECT DISTINCT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1
-               INNER JOIN Post t2
-               ON t1.parent_id = t2.id
-               WHERE t1.post_type_id = 2 AND t2.post_type_id = 1
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-
-
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-
-    else:
-        query = """SELECT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1
-               INNER JOIN Post t2
-               ON t1.parent_id = t2.id
-               WHERE t1.post_type_id = 2 AND t2.post_type_id = 1
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-            if directed:
-                weights[(src, dst)] += 1
-            else:
-                if src < dest:
-                    weights[(src, dst)] += 1
-                else:
-                    weights[(dst, src)] += 1
-
-def add_edges_accepted_answer(cur, graph, start_date, end_date, directed, weighted, weights):
-    """Add an edge between each pair of nodes where the source
-       user has an accepted answer to a question asked by the destination user.
-    """
-    if not weighted:
-        query = """SELECT DISTINCT t2.owner_user_id, t1.owner_user_id
-               FROM Post t1
-               INNER JOIN Post t2
-               ON t1.accepted_answer_id = t2.id
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-
-
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-
-    else:
-        query = """SELECT t2.owner_user_id, t1.owner_user_id
-               FROM Post t1
-               INNER JOIN Post t2
-               ON t1.accepted_answer_id = t2.id
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-            if directed:
-                weights[(src, dst)] += 1
-            else:
-                if src < dest:
-                    weights[(src, dst)] += 1
-                else:
-                    weights[(dst, src)] += 1
-
-def add_edges_answer_question_above_threshold(cur, graph, start_date, end_date, threshold, directed, weighted, weights):
-    """Add an edge between each pair of nodes where the source
-       user answered a question asked by the destination user 
-       and the desgination user is above a certain threshold.
-    """
-    if not weighted:
-        query = """SELECT DISTINCT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1, Post t2, se_user u
-               WHERE t1.parent_id = t2.id AND t2.owner_user_id = u.id
-               AND t1.post_type_id = 2 AND t2.post_type_id = 1 AND u.reputation > %(threshold)s
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date, 'threshold': threshold})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-
-    else:
-        query = """SELECT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1, Post t2, se_user u
-               WHERE t1.parent_id = t2.id AND t2.owner_user_id = u.id
-               AND t1.post_type_id = 2 AND t2.post_type_id = 1 AND u.reputation > %(threshold)s
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date, 'threshold': threshold})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-            if directed:
-                weights[(src, dst)] += 1
-            else:
-                if src < dest:
-                    weights[(src, dst)] += 1
-                else:
-                    weights[(dst, src)] += 1
-
-def add_edges_answer_question_below_threshold(cur, graph, start_date, end_date, threshold, directed, weighted, weights):
-    """Add an edge between each pair of nodes where the source
-       user answered a question asked by the destination user 
-       and the desgination user is below a certain threshold.
-    """
-    if not weighted:
-        query = """SELECT DISTINCT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1, Post t2, se_user u
-               WHERE t1.parent_id = t2.id AND t2.owner_user_id = u.id
-               AND t1.post_type_id = 2 AND t2.post_type_id = 1 AND u.reputation < %(threshold)s
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date, 'threshold': threshold})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-
-    else:
-        query = """SELECT t1.owner_user_id, t2.owner_user_id
-               FROM Post t1, Post t2, se_user u
-               WHERE t1.parent_id = t2.id AND t2.owner_user_id = u.id
-               AND t1.post_type_id = 2 AND t2.post_type_id = 1 AND u.reputation < %(threshold)s
-               AND t1.creation_date > %(start_date)s
-               AND t1.creation_date < %(end_date)s
-               AND t2.creation_date > %(start_date)s
-               AND t2.creation_Date < %(end_date)s;
-            """
-
-        cur.execute(query, {'start_date': start_date, 'end_date': end_date, 'threshold': threshold})
-        for src, dst in results(cur):
-            if src is None or dst is None:
-                continue
-            graph.AddEdge(src, dst)
-            if directed:
-                weights[(src, dst)] += 1
-            else:
-                if src < dest:
-                    weights[(src, dst)] += 1
-                else:
-                    weights[(dst, src)] += 1
-
 def get_top_user_ids(cur, percentile=.1):
     """Get the ids of the top users ranked by reputation."""
     cur.execute("SELECT count(*) FROM se_user;")
@@ -368,47 +214,128 @@ def get_top_user_ids(cur, percentile=.1):
     return [i[0] for i in results(cur)]
 
 
-def build_graph_time_slice(cur, start, end):
+def cached_edges(cur, edges=None):
+    """Returns |edges|, or the dataset's edge_cache.EdgeCache if none
+       was given, so every builder reads its edges from the cache."""
+    if edges is None:
+        edges = edge_cache.load_edge_cache(cur, cur.connection)
+    return edges
+
+
+def add_edges_from_cache(graph, edges, mask, directed=True, weighted=False):
+    """Add the edges of an edge_cache.EdgeCache selected by |mask|.
+       Each distinct pair is added once. Weighted graphs get the
+       number of occurrences of every pair as edge_weights.EdgeWeights,
+       unweighted ones an empty EdgeWeights."""
+    if not weighted:
+        src, dst = edges.pairs(mask)
+        for s, d in zip(src.tolist(), dst.tolist()):
+            graph.AddEdge(s, d)
+        return edge_weights.empty(directed)
+
+    weights = edge_weights.aggregate(*edges.pairs(mask, distinct=False), directed=directed)
+    weights.add_to_graph(graph)
+    return weights
+
+
+def build_graph_time_slice(cur, start, end, index=None, edges=None):
     graph = snap.TNGraph.New()
-    add_nodes(cur, graph)
-    add_edges_time_slice(cur, graph, start, end)
+    add_nodes(cur, graph, index)
+    edges = cached_edges(cur, edges)
+    add_edges_from_cache(graph, edges, edges.select(start, end, answerer_below_asker=True))
     return graph
 
 
-def build_graph_answer_question(cur, start_date, end_date, directed=True, weighted=False):
+def build_graph_time_slices(cur, conn, bins=TIME_BINS, index=None, edges=None):
+    """Builds the build_graph_time_slice graph of every bin at once and
+       returns them in the order of |bins|. The node list is fetched
+       once and shared by every slice, and each cached edge is routed
+       to its bin in a single pass instead of being filtered again for
+       each slice. Bins must not overlap."""
+    if edges is None:
+        edges = edge_cache.load_edge_cache(cur, conn)
+    nodes = node_ids(cur, index)
+    graphs = []
+    for bin in bins:
+        graph = snap.TNGraph.New()
+        add_nodes(cur, graph, nodes=nodes)
+        graphs.append(graph)
+
+    slices = edges.route(bins, edges.select(answerer_below_asker=True))
+    routed = slices >= 0
+    if routed.any():
+        rows = np.unique(np.column_stack((slices[routed], edges.answerer[routed], edges.asker[routed])), axis=0)
+        for slice, src, dst in rows.tolist():
+            graphs[slice].AddEdge(src, dst)
+    return graphs
+
+
+def degree_statistics(cur, conn, user_ids, bins=TIME_BINS, index=None, edges=None,
+                      quantiles=degrees.QUANTILES):
+    """Returns {'out': stats, 'in': stats} for a cohort of users in
+       every build_graph_time_slices snapshot, where stats holds the
+       per-bin mean, quantiles and distribution of the cohort's degrees
+       (see degrees.cohort_statistics). Degrees are computed from the
+       edge cache without building the graphs."""
+    if edges is None:
+        edges = edge_cache.load_edge_cache(cur, conn)
+    if index is None:
+        index = user_index.user_index(cur, conn)
+    outdeg, indeg = degrees.slice_degrees(edges, index, bins, edges.select(answerer_below_asker=True))
+    return {'out': degrees.cohort_statistics(outdeg, index, user_ids, quantiles),
+            'in': degrees.cohort_statistics(indeg, index, user_ids, quantiles)}
+
+
+def sliding_windows(cur, conn, window, step, start=None, end=None, accepted=False,
+                    answerer_below_asker=False, index=None, edges=None):
+    """Returns a sliding_window.SlidingWindow over the answerer ->
+       asker graph. Iterating it moves a |window|-long window forward
+       by |step| at a time, updating degrees and PageRank from the
+       edges that entered or left instead of rebuilding each graph.
+       |accepted| and |answerer_below_asker| restrict the edges as in
+       the accepted-answer and time-slice builders."""
+    if edges is None:
+        edges = edge_cache.load_edge_cache(cur, conn)
+    if index is None:
+        index = user_index.user_index(cur, conn)
+    mask = edges.select(accepted=accepted, answerer_below_asker=answerer_below_asker)
+    return sliding_window.SlidingWindow(edges, index, window, step, start, end, mask)
+
+
+def build_graph_answer_question(cur, start_date, end_date, directed=True, weighted=False, index=None, edges=None):
     graph = snap.TNGraph.New()
     if not directed:
         graph = snap.TUNGraph.New()
-    add_nodes(cur, graph)
-    weights = Counter()
-    add_edges_answer_question(cur, graph, start_date, end_date, directed, weighted, weights)
+    add_nodes(cur, graph, index)
+    edges = cached_edges(cur, edges)
+    weights = add_edges_from_cache(graph, edges, edges.select(start_date, end_date), directed, weighted)
     return (graph, weights)
 
-def build_graph_accepted_answer(cur, start_date, end_date, directed=True, weighted=False):
+def build_graph_accepted_answer(cur, start_date, end_date, directed=True, weighted=False, index=None, edges=None):
   graph = snap.TNGraph.New()
   if not directed:
       graph = snap.TUNGraph.New()
-  add_nodes(cur, graph)
-  weights = Counter()
-  add_edges_accepted_answer(cur, graph, start_date, end_date, directed, weighted, weights)
+  add_nodes(cur, graph, index)
+  edges = cached_edges(cur, edges)
+  weights = add_edges_from_cache(graph, edges, edges.select(start_date, end_date, accepted=True), directed, weighted)
   return (graph, weights)
 
-def build_graph_answer_question_above_threshold(cur, start_date, end_date, threshold, directed=True, weighted=False):
+def build_graph_answer_question_above_threshold(cur, start_date, end_date, threshold, directed=True, weighted=False, index=None, edges=None):
   graph = snap.TNGraph.New()
   if not directed:
       graph = snap.TUNGraph.New()
-  add_nodes(cur, graph)
-  weights = Counter()
-  add_edges_answer_question_above_threshold(cur, graph, start_date, end_date, threshold, directed, weighted, weights)
+  add_nodes(cur, graph, index)
+  edges = cached_edges(cur, edges)
+  weights = add_edges_from_cache(graph, edges, edges.select(start_date, end_date, asker_above=threshold), directed, weighted)
   return (graph, weights)
 
-def build_graph_answer_question_below_threshold(cur, start_date, end_date, threshold, directed=True, weighted=False):
+def build_graph_answer_question_below_threshold(cur, start_date, end_date, threshold, directed=True, weighted=False, index=None, edges=None):
   graph = snap.TNGraph.New()
   if not directed:
       graph = snap.TUNGraph.New()
-  add_nodes(cur, graph)
-  weights = Counter()
-  add_edges_answer_question_below_threshold(cur, graph, start_date, end_date, threshold, directed, weighted, weights)
+  add_nodes(cur, graph, index)
+  edges = cached_edges(cur, edges)
+  weights = add_edges_from_cache(graph, edges, edges.select(start_date, end_date, asker_below=threshold), directed, weighted)
   return (graph, weights)
 
 def main(argv):
@@ -423,20 +350,17 @@ def main(argv):
     # Identify nodes we're interested in.
     cur.execute("SELECT u1.id FROM se_user u1 INNER JOIN upvotes u2 ON u1.id = u2.id WHERE u2.bin1 + u2.bin2 + u2.bin3 + u2.bin4 + u2.bin5 + u2.bin6 > 1600;")
     user_ids = [user_id[0] for user_id in cur if user_id[0] != -1]
-    avg_out_degs = []
-
-    # Build a graph per time slice.
-    for bin in TIME_BINS:
-        graph = build_graph_time_slice(cur, bin[0], bin[1])
-        print "Nodes in graph:", graph.GetNodes()
-        print "Edges in graph:", graph.GetEdges()
-
-        # Record per-user outdegree at that time slice.
-        avg_out_deg = 0.0
-        for user_id in user_ids:
-            out_deg = graph.GetNI(user_id).GetOutDeg()
-            avg_out_deg = avg_out_deg + float(out_deg) / len(user_ids)
-        avg_out_degs.append(avg_out_deg)
+
+    # Per-user degrees in every time slice, straight from the cached edges.
+    index = user_index.user_index(cur, conn)
+    edges = edge_cache.load_edge_cache(cur, conn)
+    outdeg, indeg = degrees.slice_degrees(edges, index, TIME_BINS, edges.select(answerer_below_asker=True))
+    for edge_count in outdeg.sum(axis=1):
+        print "Nodes in graph:", len(index)
+        print "Edges in graph:", edge_count
+
+    # Record the users' average outdegree at each time slice.
+    avg_out_degs = degrees.cohort_statistics(outdeg, index, user_ids)['mean']
 
     # Plot average user out-degree at each time slice.
     x = range(0, len(avg_out_degs))
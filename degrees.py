@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+In- and out-degree of every user in every graph snapshot, computed
+straight from the edge cache as arrays aligned with a UserIndex.
+
+Nothing here calls into SNAP. The snapshots' distinct edges come from
+one EdgeCache.route pass, and each degree is a bincount over them:
+
+    outdeg, indeg = slice_degrees(edges, index, data_graph.TIME_BINS)
+    stats = cohort_statistics(outdeg, index, expert_ids)
+    stats['mean']         # cohort mean out-degree per snapshot
+
+The degrees are those of the graph data_graph.build_graph_time_slices
+builds for the same bins and mask.
+"""
+
+from __future__ import division
+import numpy as np
+
+QUANTILES = (.25, .5, .75, .9)
+
+def slice_degrees(edges, index, bins, mask = None):
+    """
+    Returns (outdeg, indeg), each a (snapshots x users) int64 array
+    counting every user's distinct out- and in-neighbours in each bin.
+
+    :param edges: an edge_cache.EdgeCache
+    :param index: a user_index.UserIndex; edges to users outside it
+        are dropped
+    :param bins: list of non-overlapping (start, end) dates
+    :param mask: optional EdgeCache.select mask restricting the edges
+    """
+    n = len(index)
+    slices = edges.route(bins, mask)
+    src = index.indices(edges.answerer)
+    dst = index.indices(edges.asker)
+    keep = (slices >= 0) & (src >= 0) & (dst >= 0)
+
+    # One key per (snapshot, src, dst) so repeated answers count once.
+    keys = np.unique((slices[keep] * n + src[keep]) * n + dst[keep])
+    slices = keys // (n * n)
+    src = keys // n % n
+    dst = keys % n
+    outdeg = np.bincount(slices * n + src, minlength=len(bins) * n).reshape(len(bins), n)
+    indeg = np.bincount(slices * n + dst, minlength=len(bins) * n).reshape(len(bins), n)
+    return outdeg, indeg
+
+def cohort_statistics(degrees, index, user_ids, quantiles = QUANTILES):
+    """
+    Summarizes a cohort's degrees in every snapshot at once. Returns a
+    dict with
+
+    mean         - mean degree per snapshot
+    quantiles    - (snapshots x len(quantiles)) degree quantiles
+    distribution - (snapshots x max degree + 1) array; entry [s, d]
+                   counts the cohort members with degree d in snapshot s
+
+    :param degrees: (snapshots x users) array from slice_degrees
+    :param index: the user_index.UserIndex |degrees| is aligned with
+    :param user_ids: the cohort; ids outside the index are ignored
+    :param quantiles: quantiles to report, between 0 and 1
+    """
+    rows = index.indices(user_ids)
+    cohort = degrees[:, rows[rows >= 0]]
+    snapshots, size = cohort.shape
+    if size == 0:
+        return {'mean': np.zeros(snapshots),
+                'quantiles': np.zeros((snapshots, len(quantiles))),
+                'distribution': np.zeros((snapshots, 1), dtype=np.int64)}
+
+    width = cohort.max() + 1
+    offsets = np.arange(snapshots)[:, np.newaxis] * width
+    distribution = np.bincount((cohort + offsets).ravel(), minlength=snapshots * width)
+    return {'mean': cohort.mean(axis=1),
+            'quantiles': np.percentile(cohort, np.asarray(quantiles) * 100, axis=1).T,
+            'distribution': distribution.reshape(snapshots, width)}
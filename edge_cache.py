@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""
+A columnar cache of every answerer -> asker edge in the dataset.
+
+The data_graph builders used to run their own self-join over Post for
+every graph they built. EdgeCache pulls all answer/question pairs once,
+together with both timestamps, both owners' reputations and whether the
+answer was accepted, and keeps them as parallel numpy arrays. Each
+builder variant is then a numpy mask over those arrays:
+
+    edges = edge_cache.load_edge_cache(cur, conn)
+    mask = edges.select(start, end, accepted=True)
+    src, dst = edges.pairs(mask)
+
+The cache is saved per dataset and rebuilt when the dataset version
+stamp changes.
+"""
+
+import numpy as np
+import cache_utilities
+
+CACHE_FILE = "edges.pkl"
+
+COLUMNS = ('question_id', 'answerer', 'asker', 'answer_time', 'question_time',
+           'answerer_rep', 'asker_rep', 'accepted')
+
+def to_time(value):
+    """
+    Converts a date or datetime to the cache's time representation
+    (microseconds since the epoch).
+    """
+    return np.datetime64(value, 'us').astype(np.int64)
+
+class EdgeCache(object):
+    """
+    Parallel arrays, one entry per answer:
+
+    question_id   - id of the question answered
+    answerer      - owner of the answer (edge source)
+    asker         - owner of the question (edge destination)
+    answer_time   - answer creation date, see to_time
+    question_time - question creation date, see to_time
+    answerer_rep  - answerer's reputation, NaN if not in se_user
+    asker_rep     - asker's reputation, NaN if not in se_user
+    accepted      - whether the answer is the question's accepted answer
+    """
+
+    def __init__(self, columns):
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.question_id)
+
+    def select(self, start = None, end = None, accepted = False, asker_above = None,
+               asker_below = None, answerer_below_asker = False, known_users = False):
+        """
+        Returns a boolean mask over the edges.
+
+        :param start: keep edges whose question and answer are both after start
+        :param end: keep edges whose question and answer are both before end
+        :param accepted: keep only accepted answers
+        :param asker_above: keep edges whose asker's reputation is above this
+        :param asker_below: keep edges whose asker's reputation is below this
+        :param answerer_below_asker: keep edges where the answerer has lower reputation
+        :param known_users: keep only edges whose users are both in se_user
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            start = to_time(start)
+            mask &= (self.answer_time > start) & (self.question_time > start)
+        if end is not None:
+            end = to_time(end)
+            mask &= (self.answer_time < end) & (self.question_time < end)
+        if accepted:
+            mask &= self.accepted
+        # Comparisons against NaN are false, so edges with users missing
+        # from se_user drop out here just as they do in an inner join.
+        if asker_above is not None:
+            mask &= self.asker_rep > asker_above
+        if asker_below is not None:
+            mask &= self.asker_rep < asker_below
+        if answerer_below_asker:
+            mask &= self.answerer_rep < self.asker_rep
+        if known_users:
+            mask &= ~np.isnan(self.answerer_rep) & ~np.isnan(self.asker_rep)
+        return mask
+
+    def route(self, bins, mask = None):
+        """
+        Returns, for every edge, the index of the bin in |bins| whose
+        (start, end) range strictly contains both its question and its
+        answer, or -1 if there is none. One binary search over the bin
+        starts places every edge, so routing costs the same however
+        many bins there are.
+
+        :param bins: list of (start, end) dates that must not overlap
+        :param mask: optional boolean mask; unselected edges get -1
+        """
+        if not bins:
+            return np.full(len(self), -1, dtype=np.int64)
+        starts = np.array([to_time(bin[0]) for bin in bins], dtype=np.int64)
+        ends = np.array([to_time(bin[1]) for bin in bins], dtype=np.int64)
+        order = np.argsort(starts, kind='mergesort')
+        if np.any(ends[order][:-1] > starts[order][1:]):
+            raise ValueError("Time bins must not overlap")
+
+        first = np.minimum(self.answer_time, self.question_time)
+        last = np.maximum(self.answer_time, self.question_time)
+        # The only candidate is the bin with the latest start before
+        # the edge's first post.
+        position = np.searchsorted(starts[order], first, side='left') - 1
+        candidate = order[position.clip(0)]
+        inside = (position >= 0) & (last < ends[candidate])
+        if mask is not None:
+            inside &= mask
+        return np.where(inside, candidate, -1)
+
+    def pairs(self, mask = None, distinct = True):
+        """
+        Returns (src, dst) arrays of answerer -> asker pairs for the
+        selected edges, deduplicated unless |distinct| is false.
+        """
+        src = self.answerer if mask is None else self.answerer[mask]
+        dst = self.asker if mask is None else self.asker[mask]
+        if distinct and len(src):
+            unique = np.unique(np.column_stack((src, dst)), axis=0)
+            src, dst = unique[:, 0], unique[:, 1]
+        return src, dst
+
+def extract_edges(cur):
+    """
+    Pulls every answerer -> asker edge from Post in one query.
+
+    :param cur: a Postgres database cursor
+    """
+    query = """SELECT q.id, a.owner_user_id, q.owner_user_id,
+                      a.creation_date, q.creation_date,
+                      ua.reputation, uq.reputation,
+                      q.accepted_answer_id IS NOT NULL AND q.accepted_answer_id = a.id
+               FROM Post a
+               INNER JOIN Post q
+               ON a.parent_id = q.id
+               LEFT OUTER JOIN se_user ua
+               ON ua.id = a.owner_user_id
+               LEFT OUTER JOIN se_user uq
+               ON uq.id = q.owner_user_id
+               WHERE a.post_type_id = 2 AND q.post_type_id = 1
+               AND a.owner_user_id IS NOT NULL
+               AND q.owner_user_id IS NOT NULL;
+            """
+    cur.execute(query)
+    rows = cur.fetchall()
+    if rows:
+        (question_id, answerer, asker, answer_time, question_time,
+         answerer_rep, asker_rep, accepted) = zip(*rows)
+    else:
+        (question_id, answerer, asker, answer_time, question_time,
+         answerer_rep, asker_rep, accepted) = [()] * 8
+
+    def reputations(values):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+    return EdgeCache({
+        'question_id': np.array(question_id, dtype=np.int64),
+        'answerer': np.array(answerer, dtype=np.int64),
+        'asker': np.array(asker, dtype=np.int64),
+        'answer_time': np.array(answer_time, dtype='datetime64[us]').astype(np.int64),
+        'question_time': np.array(question_time, dtype='datetime64[us]').astype(np.int64),
+        'answerer_rep': reputations(answerer_rep),
+        'asker_rep': reputations(asker_rep),
+        'accepted': np.array(accepted, dtype=bool),
+    })
+
+def load_edge_cache(cur, conn, rebuild = False):
+    """
+    Returns the EdgeCache for the dataset behind |conn|, loading it
+    from disk unless it is missing, out of date or |rebuild| is set.
+
+    :param cur: a Postgres database cursor
+    :param conn: the connection |cur| belongs to
+    """
+    return cache_utilities.cached(cache_utilities.dataset_name(conn), CACHE_FILE,
+                                  cache_utilities.dataset_version(cur),
+                                  lambda: extract_edges(cur), rebuild)
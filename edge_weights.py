@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Weighted edge lists stored as parallel numpy arrays.
+
+The weighted data_graph builders used to count edges in a Counter
+keyed by (src, dst) tuples, which costs well over a hundred bytes per
+edge. EdgeWeights keeps one int64 src, int64 dst and int64 weight per
+distinct edge instead. Weights are aggregated by sorting the raw
+edge list and summing runs of equal pairs:
+
+    weights = edge_weights.aggregate(src, dst, directed=False)
+    weights[(src_id, dst_id)]           # 0 if the edge is absent
+    indptr, indices, data = weights.to_csr(index)
+
+For undirected graphs every pair is stored as (min, max), so (a, b)
+and (b, a) add up to the same edge.
+"""
+
+import numpy as np
+
+class EdgeWeights(object):
+    """
+    Distinct edges sorted by (src, dst), each with its weight.
+
+    Supports the parts of the Counter interface the builders'
+    callers use: len, iteration over (src, dst) keys, lookup with
+    weights[(src, dst)] and iteritems.
+    """
+
+    def __init__(self, src, dst, weight, directed = True):
+        self.src = src
+        self.dst = dst
+        self.weight = weight
+        self.directed = directed
+
+    def __len__(self):
+        return len(self.src)
+
+    def __iter__(self):
+        return iter(zip(self.src.tolist(), self.dst.tolist()))
+
+    def _find(self, src, dst):
+        if not self.directed and src > dst:
+            src, dst = dst, src
+        lo = np.searchsorted(self.src, src, side='left')
+        hi = np.searchsorted(self.src, src, side='right')
+        i = lo + np.searchsorted(self.dst[lo:hi], dst)
+        if i < hi and self.dst[i] == dst:
+            return i
+        return -1
+
+    def __contains__(self, edge):
+        return self._find(*edge) >= 0
+
+    def __getitem__(self, edge):
+        i = self._find(*edge)
+        return int(self.weight[i]) if i >= 0 else 0
+
+    def get(self, edge, default = 0):
+        i = self._find(*edge)
+        return int(self.weight[i]) if i >= 0 else default
+
+    def iteritems(self):
+        return iter(zip(self, self.weight.tolist()))
+
+    def items(self):
+        return list(self.iteritems())
+
+    def total(self):
+        """
+        Returns the sum of all edge weights, i.e. the number of raw
+        edges that were aggregated.
+        """
+        return int(self.weight.sum())
+
+    def nbytes(self):
+        return self.src.nbytes + self.dst.nbytes + self.weight.nbytes
+
+    def to_csr(self, index):
+        """
+        Returns (indptr, indices, weights) arrays in compressed sparse
+        row form over the dense ids of a user_index.UserIndex. Edges
+        with an endpoint outside the index are dropped. For undirected
+        weights each edge appears once, in the row of its smaller id.
+
+        :param index: a user_index.UserIndex
+        """
+        rows = index.indices(self.src)
+        columns = index.indices(self.dst)
+        known = (rows >= 0) & (columns >= 0)
+        rows = rows[known]
+        # Rows come out sorted because src is sorted and the index
+        # preserves id order.
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(index)))))
+        return indptr, columns[known], self.weight[known]
+
+    def add_to_graph(self, graph):
+        """
+        Adds every distinct edge to a SNAP graph whose nodes already
+        exist.
+        """
+        for src, dst in zip(self.src.tolist(), self.dst.tolist()):
+            graph.AddEdge(src, dst)
+
+def empty(directed = True):
+    """
+    Returns EdgeWeights with no edges, for unweighted builds.
+    """
+    return aggregate([], [], directed)
+
+def aggregate(src, dst, directed = True, weight = None):
+    """
+    Returns the EdgeWeights of a raw edge list, summing the weights of
+    repeated edges with one sort and one reduceat.
+
+    :param src: source user ids
+    :param dst: destination user ids
+    :param directed: if false (a, b) and (b, a) are the same edge
+    :param weight: optional weight of each raw edge, 1 by default
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    if weight is None:
+        weight = np.ones(len(src), dtype=np.int64)
+    else:
+        weight = np.asarray(weight, dtype=np.int64)
+    if not directed:
+        src, dst = np.minimum(src, dst), np.maximum(src, dst)
+    if len(src) == 0:
+        return EdgeWeights(src, dst, weight, directed)
+
+    order = np.lexsort((dst, src))
+    src = src[order]
+    dst = dst[order]
+    weight = weight[order]
+    starts = np.flatnonzero(np.concatenate(([True], (src[1:] != src[:-1]) | (dst[1:] != dst[:-1]))))
+    return EdgeWeights(src[starts], dst[starts], np.add.reduceat(weight, starts), directed)
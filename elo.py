@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import requests
+import numpy as np
 from datetime import datetime
 from search_utilities import *
 
@@ -29,6 +30,100 @@ def elo_history(cursor, conn, user_id, end_date = None):
         _create_elo_table(cursor, conn)
     return _elo_history(cursor, user_id)
 
+def ensure_tables(cursor, conn):
+    """
+    Builds the elo and cau tables if they do not exist yet.
+    Call this once before sharing the tables between processes
+    so that workers do not race to build them.
+
+    :param cursor: a Postgres database cursor
+    """
+    if not _elo_table_exists(cursor):
+        _create_elo_table(cursor, conn)
+
+def elo_vector(cursor, conn, index, end_date = None):
+    """
+    Returns the ELO score of every user as an array aligned
+    with a UserIndex. Optionally consider only games played
+    up until a given end date.
+
+    :param cursor: a Postgres database cursor
+    :param index: a user_index.UserIndex
+    :param end_date: end_date for ELO calculation.
+    """
+    if not _elo_table_exists(cursor):
+        _create_elo_table(cursor, conn)
+    return ratings_vector(cursor, 'elo', index, end_date)
+
+def ratings_vector(cursor, table, index, end_date = None):
+    """
+    Returns the latest rating of every user from the elo or
+    cau table as an array aligned with a UserIndex, fetched in
+    a single query. Users without a rating keep the default
+    of 1500.
+
+    :param cursor: a Postgres database cursor
+    :param table: 'elo' or 'cau'
+    :param index: a user_index.UserIndex
+    :param end_date: end_date for the ratings.
+    """
+    if end_date is None:
+        query = """SELECT DISTINCT ON (user_id) user_id, rating
+                   FROM {}
+                   ORDER BY user_id, time DESC;
+                """.format(table)
+        cursor.execute(query)
+    else:
+        query = """SELECT DISTINCT ON (user_id) user_id, rating
+                   FROM {}
+                   WHERE time <= %(date)s
+                   ORDER BY user_id, time DESC;
+                """.format(table)
+        cursor.execute(query, {"date": end_date})
+    rows = cursor.fetchall()
+    ratings = np.empty(len(index))
+    ratings.fill(1500)
+    if rows:
+        user_ids, values = zip(*rows)
+        positions = index.indices(user_ids)
+        known = positions >= 0
+        ratings[positions[known]] = np.asarray(values, dtype=np.float64)[known]
+    return ratings
+
+def ratings_at(cursor, table, index, end_dates):
+    """
+    Returns the latest rating of every user in a UserIndex at
+    each of its own end dates from the elo or cau table, fetched
+    in a single query. end_dates[i] lists the end dates of user
+    index.ids[i], and the ratings come back in an array of the
+    same shape. Users without a rating by an end date keep the
+    default of 1500.
+
+    :param cursor: a Postgres database cursor
+    :param table: 'elo' or 'cau'
+    :param index: a user_index.UserIndex
+    :param end_dates: per-user lists of end dates, all the same length
+    """
+    end_dates = np.asarray(end_dates, dtype=object).reshape(len(index), -1)
+    ratings = np.empty(end_dates.shape)
+    ratings.fill(1500)
+    if ratings.size == 0:
+        return ratings
+    user_ids = np.repeat(index.ids, end_dates.shape[1])
+    query = """SELECT DISTINCT ON (pair.n) pair.n, r.rating
+               FROM unnest(%(users)s::bigint[], %(dates)s::timestamp[])
+                    WITH ORDINALITY AS pair(user_id, end_date, n)
+               INNER JOIN {} r
+               ON r.user_id = pair.user_id
+               AND r.time <= pair.end_date
+               ORDER BY pair.n, r.time DESC;
+            """.format(table)
+    cursor.execute(query, {"users": user_ids.tolist(), "dates": end_dates.ravel().tolist()})
+    flat = ratings.reshape(-1)
+    for n, rating in cursor:
+        flat[n - 1] = rating
+    return ratings
+
 ####################################################
 ########### Private helper methods below ###########
 ####################################################
@@ -296,7 +391,6 @@ def _cau(cursor, user_id, end_date = None):
         cursor.execute(query, {"user_id": user_id, "date": end_date})
     return cursor.fetchone()[0]
 
-
 def _users_with_creation_date(cursor):
     """
     Returns a generator for (user, creation_date)
@@ -39,35 +39,51 @@ the top 10 percentile of users by StackExchange reputation.
 from random import shuffle
 
 import sys
+import multiprocessing
+import numpy as np
+import elo
 import metrics
 import search_utilities
 import ml
+import feature_store
+import feature_pipeline
+import feature_matrix
+import user_index
+from feature_pipeline import FeatureSpec
 
 feature_percentiles = [.1, .2, .3, .4, .5]
 
-def cau_scores(cur, conn, user_id):
+# The feature set above, for use with feature_pipeline.
+feature_specs = [
+    # FeatureSpec('auth', feature_percentiles),
+    # FeatureSpec('pagerank', feature_percentiles),
+    FeatureSpec('elo', feature_percentiles),
+    FeatureSpec('cau', feature_percentiles),
+]
+
+def cau_scores(cur, conn, user_id, store = None):
     """
     Returns a user CAU scores from 10th to 50th percentile.
     """
-    return metrics.cau_for_user(cur, conn, user_id, samples = feature_percentiles)
+    return metrics.cau_for_user(cur, conn, user_id, samples = feature_percentiles, store = store)
 
-def elo_scores(cur, conn, user_id):
+def elo_scores(cur, conn, user_id, store = None):
     """
     Returns a user ELO scores from 10th to 50th percentile.
     """
-    return metrics.elo_for_user(cur, conn, user_id, samples = feature_percentiles)
+    return metrics.elo_for_user(cur, conn, user_id, samples = feature_percentiles, store = store)
 
-def pagerank_scores(cur, user_id):
+def pagerank_scores(cur, user_id, store = None):
     """
     Returns a user PageRank scores from 10th to 50th percentile.
     """
-    return metrics.pagerank_for_user(cur, user_id, samples = feature_percentiles)
+    return metrics.pagerank_for_user(cur, user_id, samples = feature_percentiles, store = store)
 
-def auth_scores(cur, user_id):
+def auth_scores(cur, user_id, store = None):
     """
     Returns a user Auth scores from 10th to 50th percentile.
     """
-    return metrics.auth_for_user(cur, user_id, samples = feature_percentiles)
+    return metrics.auth_for_user(cur, user_id, samples = feature_percentiles, store = store)
 
 def is_expert(user_id):
     """
@@ -75,10 +91,30 @@ def is_expert(user_id):
     """
     return user_id in search_utilities.get_experts()
 
-def training_examples(cur, conn, user_ids):
+def expert_labels(index):
+    """
+    Returns an array of expert (1) / nonexpert (0) labels
+    aligned with a UserIndex.
+    """
+    return index.mask(search_utilities.get_experts()).astype(int)
+
+def feature_vector(cur, conn, user_id, store = None):
+    """
+    Returns the feature vector for a single user.
+    """
+    uv = []
+    #uv += auth_scores(cur, user_id, store)
+    #uv += pagerank_scores(cur, user_id, store)
+    uv += elo_scores(cur, conn, user_id, store)
+    uv += cau_scores(cur, conn, user_id, store)
+    return uv
+
+def training_examples(cur, conn, user_ids, store = None):
     """
     Returns a set of feature vectors and labels extracted
-    from the dataset for the given user_ids.
+    from the dataset for the given user_ids. If a
+    feature_store.FeatureStore is given, cached score
+    series are reused and new ones are saved to it.
     """
     fv = []
     labels = []
@@ -86,26 +122,140 @@ def training_examples(cur, conn, user_ids):
     for user_id in user_ids:
         counter += 1
         print "Training example building progress: %f" % (float(counter) / len(user_ids))
-        uv = []
-        #uv += auth_scores(cur, user_id)
-        #uv += pagerank_scores(cur, user_id)
-        uv += elo_scores(cur, conn, user_id)
-        uv += cau_scores(cur, conn, user_id)
-        fv.append(uv)
+        fv.append(feature_vector(cur, conn, user_id, store))
         labels.append(1 if is_expert(user_id) else 0)
     return fv, labels
 
+def training_examples_to_matrix(cur, conn, user_ids, directory, chunk_size = 16, store = None):
+    """
+    Same as training_examples, but appends the feature vectors
+    in chunks to an on-disk feature_matrix.FeatureMatrix. If the
+    directory already holds a partially written matrix for the
+    same user_ids, in any order, only the missing rows are
+    computed. Rows keep the order the matrix was created with.
+    Returns (features, labels) as read-only memory maps.
+    """
+    user_ids = list(user_ids)
+    if feature_matrix.exists(directory):
+        matrix = feature_matrix.FeatureMatrix(directory, user_ids)
+        user_ids = matrix.user_ids.tolist()
+        pending = list(matrix.pending())
+    else:
+        matrix = None
+        pending = range(len(user_ids))
+
+    for start in range(0, len(pending), chunk_size):
+        rows = pending[start:start + chunk_size]
+        vectors = [feature_vector(cur, conn, user_ids[row], store) for row in rows]
+        labels = [1 if is_expert(user_ids[row]) else 0 for row in rows]
+        if matrix is None:
+            matrix = feature_matrix.FeatureMatrix(directory, user_ids, len(vectors[0]))
+        matrix.write(rows, vectors, labels)
+        print "Training example building progress: %f" % (float(len(user_ids) - len(pending) + start + len(rows)) / len(user_ids))
+    return feature_matrix.load(directory)
+
+def training_chunks(cur, conn, user_ids, chunk_size = 256, store = None):
+    """
+    Returns a generator of (feature vectors, labels) numpy chunks
+    for the given user_ids, which may itself be a generator, so
+    that ml.streaming_logistic and ml.streaming_pca can train on
+    every user of a site with bounded memory.
+    """
+    fv = []
+    labels = []
+    for user_id in user_ids:
+        fv.append(feature_vector(cur, conn, user_id, store))
+        labels.append(1 if is_expert(user_id) else 0)
+        if len(fv) == chunk_size:
+            yield np.array(fv), np.array(labels)
+            fv = []
+            labels = []
+    if fv:
+        yield np.array(fv), np.array(labels)
+
+def planned_training_examples(cur, conn, user_ids, specs = None):
+    """
+    Same as training_examples, but extracts the features through
+    feature_pipeline so snapshots, cutoffs and rating lookups are
+    shared between feature families.
+    """
+    if specs is None:
+        specs = feature_specs
+    fv = feature_pipeline.extract(cur, conn, user_ids, specs)
+    index = user_index.UserIndex(user_ids)
+    labels = expert_labels(index)[index.indices(user_ids)].tolist()
+    return fv, labels
+
+# Per-process state for parallel extraction. Each worker
+# opens its own connection since psycopg2 connections
+# cannot be shared across processes.
+_worker = {}
+
+def _init_worker(db, user, use_store):
+    conn, cur = metrics.connect(db, user)
+    _worker['conn'] = conn
+    _worker['cur'] = cur
+    _worker['store'] = feature_store.open_store(cur, conn) if use_store else None
+
+def _extract_shard(user_ids):
+    cur, conn, store = _worker['cur'], _worker['conn'], _worker['store']
+    return [feature_vector(cur, conn, user_id, store) for user_id in user_ids]
+
+def training_examples_parallel(db, user, user_ids, processes = None, shard_size = 8, use_store = True):
+    """
+    Same as training_examples, but shards the user_ids across a
+    pool of worker processes with one database connection each.
+    Feature vectors come back in the same order as user_ids
+    regardless of which worker finishes first.
+
+    :param db: name of the Postgres database
+    :param user: Postgres user to connect as
+    :param processes: number of workers, defaults to the number of cores
+    :param shard_size: number of users handed to a worker at a time
+    :param use_store: reuse and fill the on-disk feature store
+    """
+    # Build the rating tables up front so workers don't race to.
+    conn, cur = metrics.connect(db, user)
+    elo.ensure_tables(cur, conn)
+    if use_store:
+        # Opening the store once here settles its version check.
+        feature_store.open_store(cur, conn)
+    conn.close()
+
+    user_ids = list(user_ids)
+    shards = [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+    pool = multiprocessing.Pool(processes, _init_worker, (db, user, use_store))
+    try:
+        fv = []
+        for shard in pool.imap(_extract_shard, shards):
+            fv += shard
+            print "Training example building progress: %f" % (float(len(fv)) / len(user_ids))
+    finally:
+        pool.close()
+        pool.join()
+    experts = set(search_utilities.get_experts())
+    labels = [1 if user_id in experts else 0 for user_id in user_ids]
+    return fv, labels
+
 def main(args):
     conn, cur = metrics.connect("cooking", "Ben-han")
     user_ids = search_utilities.get_experts() + search_utilities.get_nonexperts()
     shuffle(user_ids)
-    data, labels = training_examples(cur, conn, user_ids)
+    store = feature_store.open_store(cur, conn)
+    data, labels = training_examples(cur, conn, user_ids, store)
+    # data, labels = training_examples_parallel("cooking", "Ben-han", user_ids)
+    # data, labels = training_examples_to_matrix(cur, conn, user_ids, "cache/cooking/matrix", store = store)
 
     train_data = data[:len(data)/2]
     train_labels = labels[:len(labels)/2]
     test_data = data[len(data)/2:]
     test_labels = labels[len(labels)/2:]
     ml.logistic_test(train_data, train_labels, train_data, train_labels, cv=True)
+    # results = ml.evaluation_grid(data, labels, feature_pipeline.feature_columns(feature_specs),
+    #                              families=[('elo',), ('cau',), ('elo', 'cau')],
+    #                              windows=[(.1,), (.1, .2, .3), tuple(feature_percentiles)],
+    #                              Cs=[0.01, 0.1, 1.0, 10.0])
+    # ml.print_grid(results)
     # ml.plot_pca(data, labels)
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+A feature matrix kept on disk as memory-mapped .npy files so that
+training example extraction can be written out chunk by chunk and
+resumed after a crash. A matrix directory holds:
+
+    user_ids.npy  - the user of each row
+    features.npy  - one feature vector per row (float64)
+    labels.npy    - expert (1) / nonexpert (0) label per row
+    done.npy      - which rows have been written
+
+Rows are only marked done after their features and labels have been
+flushed, so an interrupted run never leaves a half-written row that
+looks complete.
+
+Reading back with load() returns read-only memory maps which can be
+handed straight to ml.logistic_test or ml.plot_pca without copying.
+"""
+
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+USER_IDS_FILE = "user_ids.npy"
+FEATURES_FILE = "features.npy"
+LABELS_FILE = "labels.npy"
+DONE_FILE = "done.npy"
+
+class FeatureMatrix(object):
+
+    def __init__(self, directory, user_ids = None, columns = None):
+        """
+        Opens the matrix in |directory|, creating it for the given
+        users and number of columns if it doesn't exist yet.
+
+        :param directory: directory holding the matrix files
+        :param user_ids: the user of each row, required to create; an
+            existing matrix keeps its own row order
+        :param columns: number of features per row, required to create
+        """
+        self.directory = directory
+        if exists(directory):
+            self._open(user_ids, columns)
+        else:
+            if user_ids is None or columns is None:
+                raise ValueError("No feature matrix in {}".format(directory))
+            self._create(user_ids, columns)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _create(self, user_ids, columns):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        rows = len(user_ids)
+        self.features = open_memmap(self._path(FEATURES_FILE), mode='w+',
+                                    dtype=np.float64, shape=(rows, columns))
+        self.labels = open_memmap(self._path(LABELS_FILE), mode='w+',
+                                  dtype=np.int8, shape=(rows,))
+        self.done = open_memmap(self._path(DONE_FILE), mode='w+',
+                                dtype=np.bool_, shape=(rows,))
+        self.done.flush()
+        # Written last: its presence means the matrix is usable.
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        np.save(self._path(USER_IDS_FILE), self.user_ids)
+
+    def _open(self, user_ids, columns):
+        self.user_ids = np.load(self._path(USER_IDS_FILE))
+        self.features = open_memmap(self._path(FEATURES_FILE), mode='r+')
+        self.labels = open_memmap(self._path(LABELS_FILE), mode='r+')
+        self.done = open_memmap(self._path(DONE_FILE), mode='r+')
+        # Rows are keyed by user id, so reopening with the same users
+        # in a different order resumes the existing matrix.
+        if user_ids is not None and not np.array_equal(np.sort(self.user_ids),
+                                                       np.sort(np.asarray(user_ids, dtype=np.int64))):
+            raise ValueError("Feature matrix in {} was built for different users".format(self.directory))
+        if columns is not None and self.features.shape[1] != columns:
+            raise ValueError("Feature matrix in {} has {} columns, not {}".format(
+                self.directory, self.features.shape[1], columns))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def pending(self):
+        """
+        Returns the row numbers that still have to be written.
+        """
+        return np.flatnonzero(~self.done)
+
+    def complete(self):
+        return bool(self.done.all())
+
+    def write(self, rows, vectors, labels):
+        """
+        Writes a chunk of rows and marks them done.
+
+        :param rows: row numbers
+        :param vectors: one feature vector per row
+        :param labels: one label per row
+        """
+        rows = np.asarray(rows)
+        self.features[rows] = np.asarray(vectors, dtype=np.float64)
+        self.labels[rows] = labels
+        self.features.flush()
+        self.labels.flush()
+        self.done[rows] = True
+        self.done.flush()
+
+def exists(directory):
+    """
+    Returns true if |directory| holds a (possibly incomplete) matrix.
+    """
+    return os.path.exists(os.path.join(directory, USER_IDS_FILE))
+
+def load(directory):
+    """
+    Returns (features, labels) for a completed matrix as read-only
+    memory maps.
+
+    :param directory: directory holding the matrix files
+    """
+    done = np.load(os.path.join(directory, DONE_FILE), mmap_mode='r')
+    if not done.all():
+        raise ValueError("Feature matrix in {} is incomplete: {} of {} rows written".format(
+            directory, int(done.sum()), len(done)))
+    features = np.load(os.path.join(directory, FEATURES_FILE), mmap_mode='r')
+    labels = np.load(os.path.join(directory, LABELS_FILE), mmap_mode='r')
+    return features, labels
+
+def chunks(directory, chunk_size = 4096):
+    """
+    Returns a generator of (features, labels) chunks over the
+    completed rows of a matrix. Each chunk is a view into the
+    memory map, so only the pages being read are loaded.
+
+    :param directory: directory holding the matrix files
+    :param chunk_size: rows per chunk
+    """
+    done = np.load(os.path.join(directory, DONE_FILE), mmap_mode='r')
+    features = np.load(os.path.join(directory, FEATURES_FILE), mmap_mode='r')
+    labels = np.load(os.path.join(directory, LABELS_FILE), mmap_mode='r')
+    for start in range(0, len(done), chunk_size):
+        end = start + chunk_size
+        written = done[start:end]
+        if written.all():
+            yield features[start:end], labels[start:end]
+        elif written.any():
+            yield features[start:end][written], labels[start:end][written]
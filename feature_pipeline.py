@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+Declarative feature extraction. A feature set is a list of
+FeatureSpecs, e.g.
+
+    specs = [FeatureSpec('auth', [.1, .2, .3, .4, .5]),
+             FeatureSpec('pagerank', [.1, .2, .3, .4, .5]),
+             FeatureSpec('elo', [.1, .2, .3, .4, .5])]
+    fv = extract(cur, conn, user_ids, specs)
+
+Rather than calling metrics.*_for_user for every (user, metric) pair,
+which recomputes the percentile cutoffs and rebuilds a graph snapshot
+for every single value, the planner works out which intermediates the
+whole feature set needs:
+
+    cutoffs   - percentile_normalization for every user and the union
+                of every spec's percentiles, in one batch
+    snapshots - the graph2.build_graph_before(_undirected) graph at
+                each cutoff, grown from the edge_cache.EdgeCache by a
+                graph2.SnapshotBuilder as cutoffs are walked in order
+    scores    - HITS / PageRank / in-degree / betweenness over a
+                snapshot, so Auth and PageRank share one graph
+    ratings   - latest ELO / CAU rating of every user at each of
+                their cutoffs, in one query per table
+
+Each intermediate is computed once and dropped as soon as the last
+feature that reads it has been filled in. Scores and ratings are
+arrays aligned with a user_index.UserIndex over the users being
+extracted, so every user's value is read by position.
+"""
+
+from collections import namedtuple, defaultdict
+import graph2
+import metrics
+import elo
+import edge_cache
+import user_index
+
+# A metric sampled at a list of lifetime percentiles.
+FeatureSpec = namedtuple('FeatureSpec', 'metric samples')
+
+# metric -> (score intermediate, directed snapshot, score function,
+#            function pulling a user's value out of the scores by
+#            the user's UserIndex position)
+_GRAPH_METRICS = {
+    'auth': ('hits', True, graph2.hits_vectors, lambda scores, i: scores[1][i]),
+    'hub': ('hits', True, graph2.hits_vectors, lambda scores, i: scores[0][i]),
+    'pagerank': ('pagerank', True, graph2.pagerank_vector, lambda scores, i: scores[i]),
+    'indegree': ('indegree', True, graph2.indegree_vector, lambda scores, i: scores[i]),
+    'betweenness': ('betweenness', False, graph2.betweenness_vector, lambda scores, i: scores[i]),
+}
+
+_RATING_METRICS = ('elo', 'cau')
+
+METRICS = sorted(list(_GRAPH_METRICS) + list(_RATING_METRICS) + ['closeness'])
+
+class Plan(object):
+    """
+    The set of intermediates a feature set needs for a list of
+    users, along with how many consumers read each of them.
+
+    Graph intermediates are identified by a key tuple whose last
+    element is the cutoff time they are computed at. A rating
+    metric has a single intermediate, keyed by (metric,), holding
+    every user's rating at each of their cutoffs.
+    """
+
+    def __init__(self, specs, user_ids, cutoffs):
+        self.specs = list(specs)
+        self.user_ids = list(user_ids)
+        self.index = user_index.UserIndex(self.user_ids)
+        self.columns = sum(len(spec.samples) for spec in self.specs)
+
+        # key -> (list of dependency keys, function(cur, conn, *deps))
+        self.steps = {}
+        # key -> number of cells and steps still to read it
+        self.consumers = defaultdict(int)
+        # time -> list of (row, column, key, extract, position)
+        self.cells = defaultdict(list)
+        # directed -> graph2.SnapshotBuilder, while executing
+        self._builders = {}
+        # rating metric -> sorted percentiles it is sampled at
+        self._rating_samples = {}
+        for spec in self.specs:
+            if spec.metric in _RATING_METRICS:
+                samples = set(self._rating_samples.get(spec.metric, [])) | set(spec.samples)
+                self._rating_samples[spec.metric] = sorted(samples)
+
+        positions = self.index.indices(self.user_ids).tolist()
+        for row, user_id in enumerate(self.user_ids):
+            column = 0
+            for spec in self.specs:
+                for p in spec.samples:
+                    time = cutoffs[user_id][p]
+                    key, extract = self._add_metric(spec.metric, p, time)
+                    self.cells[time].append((row, column, key, extract, positions[row]))
+                    self.consumers[key] += 1
+                    column += 1
+
+        for table, samples in self._rating_samples.iteritems():
+            end_dates = [[cutoffs[user_id][p] for p in samples] for user_id in self.index.ids.tolist()]
+            self.steps[(table,)] = ([], lambda cur, conn, table=table, end_dates=end_dates:
+                                        elo.ratings_at(cur, table, self.index, end_dates))
+
+    def _add_metric(self, metric, p, time):
+        """
+        Registers the intermediates one feature value needs and
+        returns the key it reads along with its extractor.
+        """
+        if metric in _RATING_METRICS:
+            column = self._rating_samples[metric].index(p)
+            return (metric,), lambda ratings, i: ratings[i, column]
+
+        if metric == 'closeness':
+            ids = self.index.ids
+            return self._add_snapshot(False, time), lambda graph, i: graph2.closeness(graph, int(ids[i]))
+
+        if metric not in _GRAPH_METRICS:
+            raise ValueError("Unknown feature metric: {}".format(metric))
+        name, directed, score, extract = _GRAPH_METRICS[metric]
+        key = (name, time)
+        if key not in self.steps:
+            snapshot = self._add_snapshot(directed, time)
+            self.steps[key] = ([snapshot], lambda cur, conn, graph, score=score: score(graph, self.index))
+            self.consumers[snapshot] += 1
+        return key, extract
+
+    def _add_snapshot(self, directed, time):
+        key = ('snapshot', directed, time)
+        if key not in self.steps:
+            self.steps[key] = ([], lambda cur, conn: self._builder(cur, conn, directed).at(time))
+        return key
+
+    def _builder(self, cur, conn, directed):
+        if directed not in self._builders:
+            edges = edge_cache.load_edge_cache(cur, conn)
+            self._builders[directed] = graph2.SnapshotBuilder(cur, edges, directed)
+        return self._builders[directed]
+
+    def summary(self):
+        """
+        Returns a count of planned intermediates by kind.
+        """
+        counts = defaultdict(int)
+        for key in self.steps:
+            counts[key[0]] += 1
+        return dict(counts)
+
+    def execute(self, cur, conn):
+        """
+        Computes every feature value, walking cutoff times in
+        order. Returns one feature vector per user, in the
+        order the users were given.
+        """
+        fv = [[None] * self.columns for user_id in self.user_ids]
+        # Snapshots grow in place, which works because every value at
+        # one cutoff is computed before moving on to the next.
+        self._builders = {}
+        live = {}
+        consumers = dict(self.consumers)
+
+        def acquire(key):
+            if key not in live:
+                deps, compute = self.steps[key]
+                live[key] = compute(cur, conn, *[acquire(dep) for dep in deps])
+                for dep in deps:
+                    release(dep)
+            return live[key]
+
+        def release(key):
+            consumers[key] -= 1
+            if consumers[key] == 0:
+                del live[key]
+
+        for time in sorted(self.cells):
+            for row, column, key, extract, position in self.cells[time]:
+                fv[row][column] = extract(acquire(key), position)
+                release(key)
+        self._builders = {}
+        return fv
+
+def feature_columns(specs):
+    """
+    Returns (metric, percentile) for each column of the feature
+    vectors extract() produces for the given specs.
+    """
+    return [(spec.metric, p) for spec in specs for p in spec.samples]
+
+def cutoffs(cur, user_ids, specs):
+    """
+    Returns {user_id: {percentile: cutoff time}} covering every
+    percentile used by any of the specs, fetched for all users
+    at once with metrics.percentile_normalization_batch.
+    """
+    samples = sorted(set(p for spec in specs for p in spec.samples))
+    times = metrics.percentile_normalization_batch(user_ids, cur, samples)
+    return dict((user_id, dict(zip(samples, times[user_id]))) for user_id in times)
+
+def plan(cur, user_ids, specs):
+    """
+    Returns the Plan for extracting the given feature set for
+    the given users.
+    """
+    return Plan(specs, user_ids, cutoffs(cur, user_ids, specs))
+
+def extract(cur, conn, user_ids, specs):
+    """
+    Returns one feature vector per user with the values of every
+    spec in order, i.e. the same layout as concatenating the
+    metrics.*_for_user results for each spec.
+    """
+    if not user_ids:
+        return []
+    if any(spec.metric in _RATING_METRICS for spec in specs):
+        elo.ensure_tables(cur, conn)
+    return plan(cur, user_ids, specs).execute(cur, conn)
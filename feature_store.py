@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+On-disk store for per-user metric series such as the ELO, CAU,
+PageRank and Auth scores sampled at lifetime percentiles. Entries are
+keyed by (dataset, metric, user, percentile set) and the whole store
+is dropped when the dataset version stamp changes, so repeated
+experiments and plots load cached vectors instead of hitting
+Postgres and SNAP again.
+
+Usage:
+    store = feature_store.open_store(cur, conn)
+    scores = metrics.elo_for_user(cur, conn, user_id, samples, store = store)
+"""
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+import cache_utilities
+
+STORE_DIR = "features"
+
+class FeatureStore(object):
+    """
+    A directory of .npy files laid out as
+    <metric>/<percentile set>/<user_id>.npy.
+    """
+
+    def __init__(self, dataset, version):
+        self.dataset = dataset
+        self.version = version
+        self.root = cache_utilities.versioned_dir(dataset, STORE_DIR, version)
+
+    def _path(self, metric, user_id, samples):
+        return os.path.join(self.root, metric, percentile_key(samples), "%d.npy" % user_id)
+
+    def get(self, metric, user_id, samples):
+        """
+        Returns the cached series for a user, or None if it has
+        not been computed yet.
+
+        :param metric: metric name, e.g. 'elo'
+        :param user_id: the user id
+        :param samples: the lifetime percentiles the series is sampled at
+        """
+        path = self._path(metric, user_id, samples)
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+    def put(self, metric, user_id, samples, values):
+        """
+        Saves the series for a user. The file is written under a
+        temporary name and renamed into place so concurrent readers
+        never see a partial entry.
+
+        :param metric: metric name, e.g. 'elo'
+        :param user_id: the user id
+        :param samples: the lifetime percentiles the series is sampled at
+        :param values: the series
+        """
+        path = self._path(metric, user_id, samples)
+        directory = os.path.dirname(path)
+        cache_utilities.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(suffix=".npy", dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.asarray(values, dtype=np.float64))
+        os.rename(tmp_path, path)
+
+    def fetch(self, metric, user_id, samples, compute):
+        """
+        Returns the cached series for a user, calling |compute|
+        and caching its result on a miss.
+
+        :param metric: metric name, e.g. 'elo'
+        :param user_id: the user id
+        :param samples: the lifetime percentiles the series is sampled at
+        :param compute: function of no arguments returning the series
+        """
+        values = self.get(metric, user_id, samples)
+        if values is None:
+            values = compute()
+            self.put(metric, user_id, samples, values)
+        return list(values)
+
+def percentile_key(samples):
+    """
+    Returns a short, stable directory name for a percentile set.
+
+    :param samples: the lifetime percentiles
+    """
+    text = ",".join("%.6g" % p for p in samples)
+    return hashlib.md5(text).hexdigest()[:12]
+
+def open_store(cursor, conn):
+    """
+    Returns the FeatureStore for the dataset behind |conn|,
+    invalidated against its current version stamp.
+
+    :param cursor: a Postgres database cursor
+    :param conn: the connection |cursor| belongs to
+    """
+    return FeatureStore(cache_utilities.dataset_name(conn),
+                        cache_utilities.dataset_version(cursor))
@@ -8,6 +8,11 @@ along with helpers for getting HITS and PageRank scores from a graph.
 import psycopg2
 import snap
 import sys
+import heapq
+import hashlib
+import numpy as np
+import edge_cache
+import graph_store
 from datetime import date
 from collections import Counter
 from dateutil.parser import parse
@@ -23,8 +28,14 @@ def connect(db=DB_NAME, user=DB_USER):
     return conn, cur
 
 
-def add_nodes(cur, graph):
-    """Add users to graph as nodes."""
+def add_nodes(cur, graph, index=None):
+    """Add users to graph as nodes. If a UserIndex is given the
+       node set is taken from it instead of querying se_user."""
+    if index is not None:
+        for user_id in index.ids:
+            graph.AddNode(int(user_id))
+        return
+
     cur.execute("SELECT id FROM se_user;")
     for row in cur:
         user_id = row[0]
@@ -66,11 +77,28 @@ def add_edges(cur, graph):
         graph.AddEdge(src, dst)
 
 
-def add_edges_before(cur, graph, cutoff):
-    """Add a directed edge between each pair of nodes where the source
-       user answered a question asked by the destination user.
-    """
+def add_active_nodes(graph, pairs):
+    """Add only the users that appear in at least one of the given
+       (src, dst) pairs as nodes."""
+    for pair in pairs:
+        for user_id in pair:
+            # Filter out dummy users with ID < 0.
+            if user_id >= 0 and not graph.IsNode(user_id):
+                graph.AddNode(user_id)
+
+
+def node_count(cur, cutoff=None):
+    """Number of nodes add_nodes adds, or add_nodes_before if a
+       cutoff is given."""
+    if cutoff is None:
+        cur.execute("SELECT count(*) FROM se_user WHERE id >= 0;")
+    else:
+        cur.execute("SELECT count(*) FROM se_user WHERE id >= 0 AND creation_date <= %s;", (cutoff,))
+    return cur.fetchone()[0]
 
+
+def edges_before(cur, cutoff):
+    """Returns the distinct (src, dst) pairs add_edges_before adds."""
     query = """SELECT DISTINCT t1.owner_user_id, t2.owner_user_id
                FROM Post t1
                INNER JOIN Post t2
@@ -81,34 +109,125 @@ def add_edges_before(cur, graph, cutoff):
             """
 
     cur.execute(query, {'cutoff': cutoff})
-    for src, dst in cur:
-        if src is None or dst is None:
-            continue
+    return [(src, dst) for src, dst in cur if src is not None and dst is not None]
+
+
+def add_edges_before(cur, graph, cutoff, pairs=None):
+    """Add a directed edge between each pair of nodes where the source
+       user answered a question asked by the destination user.
+    """
+    if pairs is None:
+        pairs = edges_before(cur, cutoff)
+    for src, dst in pairs:
         graph.AddEdge(src, dst)
 
 
-def build_graph(cur):
+def _store_kind(nodes, index=None):
+    """The graph_store kind an answer graph snapshot is saved under.
+       Only the 'all' node set reads |index|; when it does, the kind
+       carries a digest of the index's ids, so a snapshot built over
+       one UserIndex is never served for se_user or another index."""
+    if nodes != 'all' or index is None:
+        return 'answers-' + nodes
+    return 'answers-all-' + hashlib.md5(index.ids.tobytes()).hexdigest()
+
+def build_graph(cur, index=None, store=None):
+    if store is not None:
+        return store.fetch(_store_kind('all', index), None, True, lambda: build_graph(cur, index))
     graph = snap.TNGraph.New()
-    add_nodes(cur, graph)
+    add_nodes(cur, graph, index)
     add_edges(cur, graph)
     return graph
 
-def build_graph_before(cur, cutoff):
+def add_nodes_for(cur, graph, cutoff, nodes, index=None):
+    """Add the nodes of a snapshot at |cutoff| and return the edge
+       pairs to add to it. |nodes| selects the node set:
+
+       'all'     - every user, as add_nodes
+       'created' - users created by the cutoff, as add_nodes_before
+       'active'  - only users with at least one edge by the cutoff.
+                   Pass node_count(cur) as |total| to pagerank to
+                   get the same ranks as the 'all' graph.
+    """
+    pairs = edges_before(cur, cutoff)
+    if nodes == 'all':
+        add_nodes(cur, graph, index)
+    elif nodes == 'created':
+        add_nodes_before(cur, graph, cutoff)
+    elif nodes == 'active':
+        add_active_nodes(graph, pairs)
+    else:
+        raise ValueError("Unknown node set: {}".format(nodes))
+    return pairs
+
+def build_graph_before(cur, cutoff, index=None, nodes='all', store=None):
+    """Snapshot of the answer graph at |cutoff|. If a
+       graph_store.GraphStore is given the snapshot is loaded from
+       it, or built and saved there the first time."""
     if type(cutoff) == 'str':
         cutoff = parse(cutoff)
+    if store is not None:
+        return store.fetch(_store_kind(nodes, index), cutoff, True,
+                           lambda: build_graph_before(cur, cutoff, index, nodes))
     graph = snap.TNGraph.New()
-    add_nodes(cur, graph)
-    add_edges_before(cur, graph, cutoff)
+    pairs = add_nodes_for(cur, graph, cutoff, nodes, index)
+    add_edges_before(cur, graph, cutoff, pairs)
     return graph
 
-def build_graph_before_undirected(cur, cutoff):
+def build_graph_before_undirected(cur, cutoff, index=None, nodes='all', store=None):
     if type(cutoff) == 'str':
         cutoff = parse(cutoff)
+    if store is not None:
+        return store.fetch(_store_kind(nodes, index), cutoff, False,
+                           lambda: build_graph_before_undirected(cur, cutoff, index, nodes))
     graph = snap.TUNGraph.New()
-    add_nodes(cur, graph)
-    add_edges_before(cur, graph, cutoff)
+    pairs = add_nodes_for(cur, graph, cutoff, nodes, index)
+    add_edges_before(cur, graph, cutoff, pairs)
     return graph
 
+class SnapshotBuilder(object):
+    """Builds build_graph_before snapshots for a series of increasing
+       cutoffs by growing one graph. The asker -> answerer pairs are
+       taken from an edge_cache.EdgeCache, each with the time it first
+       appears (the later of the question and answer creation dates),
+       and sorted by that time; each call to at() only adds the pairs
+       that appeared since the last cutoff.
+
+       The graph returned by at() is updated in place by the next call,
+       so anything computed from it must be computed before moving on."""
+
+    def __init__(self, cur, edges, directed=True, index=None):
+        src, dst = edges.asker, edges.answerer
+        appeared = np.maximum(edges.answer_time, edges.question_time)
+        # Keep the earliest appearance of every pair.
+        order = np.lexsort((appeared, dst, src))
+        src, dst, appeared = src[order], dst[order], appeared[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        src, dst, appeared = src[first], dst[first], appeared[first]
+        order = np.argsort(appeared, kind='mergesort')
+        self.src = src[order]
+        self.dst = dst[order]
+        self.times = appeared[order]
+        self.graph = snap.TNGraph.New() if directed else snap.TUNGraph.New()
+        add_nodes(cur, self.graph, index)
+        self.added = 0
+        self.cutoff = None
+
+    def at(self, cutoff):
+        """Returns the graph build_graph_before(cur, cutoff) would
+           build. Cutoffs must not decrease from one call to the next."""
+        cutoff = edge_cache.to_time(cutoff)
+        if self.cutoff is not None and cutoff < self.cutoff:
+            raise ValueError("Snapshot cutoffs must not decrease")
+        end = np.searchsorted(self.times, cutoff, side='right')
+        if end > self.added:
+            for src, dst in zip(self.src[self.added:end].tolist(), self.dst[self.added:end].tolist()):
+                self.graph.AddEdge(src, dst)
+            self.added = end
+        self.cutoff = cutoff
+        return self.graph
+
 def hits(graph):
     hubs = snap.TIntFltH()
     auths = snap.TIntFltH()
@@ -116,41 +235,121 @@ def hits(graph):
     return dict((k, (hubs[k], auths[k])) for k in hubs)
 
 
-def pagerank(graph):
-    ranks = snap.TIntFltH()
-    snap.GetPageRank(graph, ranks)
-    return dict((k, ranks[k]) for k in ranks)
+def pagerank(graph, total=None):
+    """PageRank of every node. If the graph was pruned to its active
+       users, |total| is the number of nodes in the full graph; the
+       teleport and leaked mass is then spread over all |total| users,
+       so the ranks match those of the full graph. Every user left out
+       of the graph has rank (1 - sum of the returned ranks) / (total -
+       graph.GetNodes()).
+
+       HITS needs no such correction: isolated nodes end up with zero
+       hub and authority scores and don't change anyone else's."""
+    if total is None or total <= graph.GetNodes():
+        ranks = snap.TIntFltH()
+        snap.GetPageRank(graph, ranks)
+        return dict((k, ranks[k]) for k in ranks)
+    return _pagerank_pruned(graph, total)
+
+def _pagerank_pruned(graph, total, damping=0.85, tolerance=1e-4, max_iter=100):
+    # Same iteration as snap.GetPageRank, with the users outside the
+    # graph folded into one rank they all share, since nothing links
+    # to them and they link to nobody.
+    ids = np.array([node.GetId() for node in graph.Nodes()], dtype=np.int64)
+    order = np.argsort(ids)
+    ids = ids[order]
+    pairs = np.array([(edge.GetSrcNId(), edge.GetDstNId()) for edge in graph.Edges()], dtype=np.int64).reshape(-1, 2)
+    src = np.searchsorted(ids, pairs[:, 0])
+    dst = np.searchsorted(ids, pairs[:, 1])
+    if not graph.HasFlag(snap.gfDirected):
+        # Undirected edges count in both directions, self-loops once.
+        loop = src == dst
+        src, dst = np.concatenate((src, dst[~loop])), np.concatenate((dst, src[~loop]))
+    n = len(ids)
+    rank = _power_iteration(src, dst, n, total, np.ones(n) / total, damping, tolerance, max_iter)
+    return dict(zip(ids.tolist(), rank.tolist()))
+
+def _power_iteration(src, dst, n, total, start, damping=0.85, tolerance=1e-4, max_iter=100):
+    """
+    Runs PageRank power iteration as snap.GetPageRank does, spreading
+    the mass lost at nodes without out-edges evenly over all |total|
+    nodes. Only the first |n| nodes are passed in; the other
+    total - n have no edges at all, so they share one rank that is
+    tracked as a single value. Returns the ranks of the first n.
+
+    :param src: edge sources, as indices below n
+    :param dst: edge destinations, as indices below n
+    :param n: number of nodes with their own rank
+    :param total: number of nodes in the whole graph, at least n
+    :param start: initial ranks of the first n nodes
+    :param damping: PageRank damping factor
+    :param tolerance: stop when the L1 change drops below this
+    :param max_iter: iteration limit
+    """
+    if n == 0:
+        return np.zeros(0)
+    share = damping / np.maximum(np.bincount(src, minlength=n), 1)
+    rank = start
+    isolated = (1.0 - rank.sum()) / (total - n) if total > n else 0.0
+    for i in range(max_iter):
+        # np.bincount returns int64 when there are no edges.
+        updated = np.bincount(dst, weights=rank[src] * share[src], minlength=n).astype(np.float64)
+        leaked = (1.0 - updated.sum()) / total
+        updated += leaked
+        change = np.abs(updated - rank).sum() + (total - n) * abs(leaked - isolated)
+        rank = updated
+        isolated = leaked
+        if change < tolerance:
+            break
+    return rank
 
 def indegree(graph):
     indegrees = snap.TIntPrV()
     snap.GetNodeInDegV(graph, indegrees)
     return dict((indegrees[i].GetVal1(), indegrees[i].GetVal2()) for i in range(indegrees.Len()))
 
+def hits_vectors(graph, index):
+    """Returns (hubs, auths) as arrays aligned with a UserIndex."""
+    ranks = hits(graph)
+    hubs = index.to_array(dict((k, v[0]) for k, v in ranks.iteritems()))
+    auths = index.to_array(dict((k, v[1]) for k, v in ranks.iteritems()))
+    return hubs, auths
+
+def pagerank_vector(graph, index):
+    """Returns PageRank scores as an array aligned with a UserIndex."""
+    return index.to_array(pagerank(graph))
+
+def indegree_vector(graph, index):
+    """Returns in-degrees as an array aligned with a UserIndex."""
+    return index.to_array(indegree(graph), default=0, dtype=np.int64)
+
 def betweenness(graph):
     betweenness = snap.TIntFltH()
     unused = snap.TIntPrFltH()
     snap.GetBetweennessCentr(graph, betweenness, unused, 1.0)
     return dict((k, betweenness[k]) for k in betweenness)
 
+def betweenness_vector(graph, index):
+    """Returns betweenness centrality as an array aligned with a UserIndex."""
+    return index.to_array(betweenness(graph))
+
 def closeness(graph, userID):
     return snap.GetClosenessCentr(graph, userID)
 
 def top_n_pr(pr_ranks, n):
-    return list(sorted(pr_ranks.items(), reverse=True,
-            key = lambda x: x[1]))[:n]
+    # nlargest keeps a heap of n entries instead of sorting every node.
+    return heapq.nlargest(n, pr_ranks.iteritems(), key = lambda x: x[1])
 
 
 def top_n_auths(hits_ranks, n):
-    return list(sorted(hits_ranks.items(), reverse=True,
-            key = lambda x: x[1][1]))[:n]
+    return heapq.nlargest(n, hits_ranks.iteritems(), key = lambda x: x[1][1])
 
 
 def top_n_hubs(hits_ranks, n):
-    return list(sorted(hits_ranks.items(),
-            reverse=True, key = lambda x: x[1][0]))[:n]
+    return heapq.nlargest(n, hits_ranks.iteritems(), key = lambda x: x[1][0])
 
 def get_metrics():
     conn, cur = connect()
-    graph = build_graph(cur)
+    graph = build_graph(cur, store=graph_store.open_store(cur, conn))
     return graph, pagerank(graph), hits(graph)
 
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+On-disk store for built graph snapshots, keyed by (dataset, kind,
+cutoff, directed). A snapshot is saved as three flat int64 arrays
+(node ids, edge sources, edge destinations) and loaded back through
+a memory map, so rebuilding a snapshot that was computed before needs
+no Postgres query. Separate processes loading the same snapshot also
+share its pages instead of each building a copy. Like the feature
+store, the whole store is dropped when the dataset version stamp
+changes.
+
+Usage:
+    store = graph_store.open_store(cur, conn)
+    graph = graph2.build_graph_before(cur, cutoff, store = store)
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import snap
+import cache_utilities
+
+STORE_DIR = "graphs"
+ARRAYS = ('nodes', 'src', 'dst')
+
+class GraphSnapshot(object):
+    """
+    A graph as parallel arrays: the node ids and one (src, dst)
+    pair per edge. Arrays loaded from the store are read-only
+    memory maps.
+    """
+
+    def __init__(self, nodes, src, dst, directed = True):
+        self.nodes = nodes
+        self.src = src
+        self.dst = dst
+        self.directed = directed
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Copies a SNAP TNGraph or TUNGraph into arrays.
+        """
+        nodes = np.array([node.GetId() for node in graph.Nodes()], dtype=np.int64)
+        edges = np.array([(edge.GetSrcNId(), edge.GetDstNId()) for edge in graph.Edges()],
+                         dtype=np.int64).reshape(-1, 2)
+        return cls(nodes, edges[:, 0].copy(), edges[:, 1].copy(), graph.HasFlag(snap.gfDirected))
+
+    def to_graph(self):
+        """
+        Returns the snapshot as a SNAP graph.
+        """
+        if self.directed:
+            graph = snap.TNGraph.New(len(self.nodes), len(self.src))
+        else:
+            graph = snap.TUNGraph.New(len(self.nodes), len(self.src))
+        for node in self.nodes.tolist():
+            graph.AddNode(node)
+        for src, dst in zip(self.src.tolist(), self.dst.tolist()):
+            graph.AddEdge(src, dst)
+        return graph
+
+class GraphStore(object):
+    """
+    A directory per snapshot laid out as
+    <kind>/<cutoff>-<directed|undirected>/{nodes,src,dst}.npy.
+    """
+
+    def __init__(self, dataset, version):
+        self.dataset = dataset
+        self.version = version
+        self.root = cache_utilities.versioned_dir(dataset, STORE_DIR, version)
+
+    def _path(self, kind, cutoff, directed):
+        name = "%s-%s" % (cutoff_key(cutoff), "directed" if directed else "undirected")
+        return os.path.join(self.root, kind, name)
+
+    def get(self, kind, cutoff, directed = True):
+        """
+        Returns the saved GraphSnapshot, memory-mapped, or None if
+        it has not been built yet.
+
+        :param kind: name of the graph builder, e.g. 'answers'
+        :param cutoff: the snapshot's cutoff time, None for no cutoff
+        :param directed: whether the graph is directed
+        """
+        path = self._path(kind, cutoff, directed)
+        if not os.path.isdir(path):
+            return None
+        arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode='r') for name in ARRAYS]
+        return GraphSnapshot(*arrays, directed=directed)
+
+    def put(self, kind, cutoff, directed, graph):
+        """
+        Saves a SNAP graph. The arrays are written to a temporary
+        directory that is renamed into place, so concurrent readers
+        never see a partial snapshot.
+
+        :param kind: name of the graph builder, e.g. 'answers'
+        :param cutoff: the snapshot's cutoff time, None for no cutoff
+        :param directed: whether the graph is directed
+        :param graph: a SNAP graph or a GraphSnapshot
+        """
+        if not isinstance(graph, GraphSnapshot):
+            graph = GraphSnapshot.from_graph(graph)
+        path = self._path(kind, cutoff, directed)
+        parent = os.path.dirname(path)
+        cache_utilities.makedirs(parent)
+        tmp_path = tempfile.mkdtemp(dir=parent)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_path, name + ".npy"), np.asarray(getattr(graph, name), dtype=np.int64))
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process saved the same snapshot first.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def fetch(self, kind, cutoff, directed, build):
+        """
+        Returns the snapshot as a SNAP graph, calling |build| and
+        saving its result if it is not in the store yet.
+
+        :param kind: name of the graph builder, e.g. 'answers'
+        :param cutoff: the snapshot's cutoff time, None for no cutoff
+        :param directed: whether the graph is directed
+        :param build: function of no arguments returning a SNAP graph
+        """
+        snapshot = self.get(kind, cutoff, directed)
+        if snapshot is not None:
+            return snapshot.to_graph()
+        graph = build()
+        self.put(kind, cutoff, directed, graph)
+        return graph
+
+def cutoff_key(cutoff):
+    """
+    Returns a file name for a cutoff time.
+
+    :param cutoff: a date, datetime or None
+    """
+    if cutoff is None:
+        return "all"
+    return str(np.datetime64(cutoff, 'us')).replace(':', '-')
+
+def open_store(cursor, conn):
+    """
+    Returns the GraphStore for the dataset behind |conn|,
+    invalidated against its current version stamp.
+
+    :param cursor: a Postgres database cursor
+    :param conn: the connection |cursor| belongs to
+    """
+    return GraphStore(cache_utilities.dataset_name(conn),
+                      cache_utilities.dataset_version(cursor))
@@ -1,9 +1,211 @@
 #!/usr/bin/env python
 
-import search_utilities
+"""
+Graphs of users built from question/answer relations. One streaming
+scan of Post, ordered so that every question is followed by its
+answers, produces three relations at once:
+
+    answer   - asker -> answerer, for every answer
+    accepted - asker -> answerer, for accepted answers only
+    coanswer - answerer <-> answerer, for two users answering the
+               same question (stored once, smaller id first)
+
+Each relation is kept as numpy arrays of source, destination and the
+first and last creation time of the posts involved. Graphs for any
+combination of relations and time bins are then built from those
+arrays without going back to the database:
+
+    relations = qa_relations(cursor)
+    graphs = relations.graphs(timebins, ['answer', 'accepted'])
+"""
+
+import numpy as np
 import snap
+import edge_cache
+import search_utilities
+
+RELATIONS = ('answer', 'accepted', 'coanswer')
+
+class QARelations(object):
+    """
+    Edge arrays for every relation. edges[relation] is a dict with
+    int64 arrays 'src', 'dst', 'first' and 'last', the latter two
+    being the earliest and latest creation time (microseconds since
+    the epoch) among the question and answers behind the edge.
+    """
+
+    def __init__(self, edges):
+        self.edges = edges
+
+    def select(self, relation, timebin = None):
+        """
+        Returns (src, dst) arrays for one relation, keeping only the
+        edges whose posts all fall strictly inside the time bin.
 
-def qa_graph(cursor, directed = True, timebin = None):
+        :param relation: one of RELATIONS
+        :param timebin: optional (start, end) time bin
+        """
+        if relation not in self.edges:
+            raise ValueError("Unknown relation: {}".format(relation))
+        edges = self.edges[relation]
+        if timebin is None:
+            return edges['src'], edges['dst']
+        start, end = edge_cache.to_time(timebin[0]), edge_cache.to_time(timebin[1])
+        mask = (edges['first'] > start) & (edges['last'] < end)
+        return edges['src'][mask], edges['dst'][mask]
+
+    def pairs(self, relations = RELATIONS, timebin = None, directed = True):
+        """
+        Returns the distinct (src, dst) pairs of the union of the
+        given relations, as an (edges x 2) array. For undirected
+        graphs each pair is given once, smaller id first.
+
+        :param relations: relation names to combine
+        :param timebin: optional (start, end) time bin
+        :param directed: whether edge direction matters
+        """
+        selected = [self.select(relation, timebin) for relation in relations]
+        src = np.concatenate([s for s, d in selected] + [np.zeros(0, dtype=np.int64)])
+        dst = np.concatenate([d for s, d in selected] + [np.zeros(0, dtype=np.int64)])
+        if not directed:
+            src, dst = np.minimum(src, dst), np.maximum(src, dst)
+        pairs = np.column_stack((src, dst))
+        if len(pairs):
+            pairs = np.unique(pairs, axis=0)
+        return pairs
+
+    def graph(self, relations = RELATIONS, timebin = None, directed = True, nodes = None):
+        """
+        Returns a SNAP graph of the union of the given relations.
+        Nodes are the users in |nodes| plus every edge endpoint.
+
+        :param relations: relation names to combine
+        :param timebin: optional (start, end) time bin
+        :param directed: whether the graph should be directed
+        :param nodes: optional user ids to include even without edges
+        """
+        pairs = self.pairs(relations, timebin, directed)
+        ids = pairs.ravel()
+        if nodes is not None:
+            ids = np.concatenate((ids, np.asarray(list(nodes), dtype=np.int64)))
+        # Filter out dummy users with ID < 0.
+        ids = np.unique(ids)
+        ids = ids[ids >= 0]
+        pairs = pairs[(pairs >= 0).all(axis=1)]
+
+        if directed:
+            graph = snap.TNGraph.New(len(ids), len(pairs))
+        else:
+            graph = snap.TUNGraph.New(len(ids), len(pairs))
+        for user_id in ids.tolist():
+            graph.AddNode(user_id)
+        for src, dst in pairs.tolist():
+            graph.AddEdge(src, dst)
+        return graph
+
+    def graphs(self, timebins, relations = RELATIONS, directed = True, nodes = None):
+        """
+        Returns one graph per time bin, in order, for the union of
+        the given relations.
+
+        :param timebins: list of (start, end) time bins
+        :param relations: relation names to combine
+        :param directed: whether the graphs should be directed
+        :param nodes: optional user ids to include in every graph
+        """
+        if nodes is not None:
+            nodes = np.asarray(list(nodes), dtype=np.int64)
+        return [self.graph(relations, timebin, directed, nodes) for timebin in timebins]
+
+class _RelationBuffer(object):
+    """
+    Collects edges into Python lists and moves them into numpy
+    arrays every |batch_size| edges.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.pending = ([], [], [], [])
+        self.chunks = []
+
+    def add(self, src, dst, first, last):
+        for column, value in zip(self.pending, (src, dst, first, last)):
+            column.append(value)
+        if len(self.pending[0]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending[0]:
+            self.chunks.append([np.array(column, dtype=np.int64) for column in self.pending])
+            self.pending = ([], [], [], [])
+
+    def arrays(self):
+        self.flush()
+        columns = zip(*self.chunks) if self.chunks else [[]] * 4
+        return dict((name, np.concatenate([np.zeros(0, dtype=np.int64)] + list(column)))
+                    for name, column in zip(('src', 'dst', 'first', 'last'), columns))
+
+def _add_question(buffers, question, answers):
+    """
+    Adds the edges one question and its answers give rise to.
+    question is (id, accepted_answer_id, asker, time) and answers
+    a list of (id, answerer, time).
+    """
+    question_id, accepted_answer_id, asker, question_time = question
+    for answer_id, answerer, answer_time in answers:
+        if asker is None or answerer is None:
+            continue
+        first, last = min(question_time, answer_time), max(question_time, answer_time)
+        buffers['answer'].add(asker, answerer, first, last)
+        if answer_id == accepted_answer_id:
+            buffers['accepted'].add(asker, answerer, first, last)
+
+    answers = [answer for answer in answers if answer[1] is not None]
+    for i in range(len(answers)):
+        for j in range(i + 1, len(answers)):
+            a, b = answers[i][1], answers[j][1]
+            if a == b:
+                continue
+            times = (question_time, answers[i][2], answers[j][2])
+            buffers['coanswer'].add(min(a, b), max(a, b), min(times), max(times))
+
+def qa_relations(cursor, batch_size = 10000):
+    """
+    Returns the QARelations of the whole dataset, built from a
+    single server-side scan of Post.
+
+    :param cursor: a Postgres database cursor
+    :param batch_size: rows fetched, and edges buffered, per batch
+    """
+    query = """SELECT id, post_type_id, parent_id, accepted_answer_id, owner_user_id,
+                      (EXTRACT(EPOCH FROM creation_date) * 1000000)::bigint
+               FROM Post
+               WHERE post_type_id IN (1, 2)
+               ORDER BY COALESCE(parent_id, id), post_type_id, id;
+            """
+    # A named cursor streams rows from the server batch by batch.
+    stream = cursor.connection.cursor(name='qa_relations')
+    stream.itersize = batch_size
+    stream.execute(query)
+
+    buffers = dict((relation, _RelationBuffer(batch_size)) for relation in RELATIONS)
+    question = None
+    answers = []
+    for post_id, post_type, parent_id, accepted_answer_id, owner, time in stream:
+        if post_type == 1:
+            if question is not None:
+                _add_question(buffers, question, answers)
+            question = (post_id, accepted_answer_id, owner, time)
+            answers = []
+        elif question is not None and parent_id == question[0]:
+            answers.append((post_id, owner, time))
+    if question is not None:
+        _add_question(buffers, question, answers)
+    stream.close()
+
+    return QARelations(dict((relation, buffers[relation].arrays()) for relation in RELATIONS))
+
+def qa_graph(cursor, directed = True, timebin = None, relations = ('answer',), active = False):
     """
     Returns a SNAP graph of users where user A is
     connected to user B if user B answered a question
@@ -11,28 +213,12 @@ def qa_graph(cursor, directed = True, timebin = None):
     answers made within a given timebin.
 
     :param cursor: a Postgres database cursor
-    :param directed: whether the graph should be directed 
+    :param directed: whether the graph should be directed
     :param timebin: a timebin to filter answers
+    :param relations: relations to include, see RELATIONS
+    :param active: leave out users without any edge
     """
-    if directed:
-        graph = snap.TNGraph.New()
-    else:
-        graph = snap.TUNGraph.New()
-
-    # Add nodes
-    users = search_utilities.users_above_threshold(cursor, 0)
-    for user_id in users:
-        # Filter out dummy users with ID < 0.
-        if user_id < 0:
-            continue
-        graph.AddNode(user_id)
-
-    # Build edges
-    pairs = search_utilities.asker_answerer_pairs(cur, timebin)
-    for (asker, answerer) in pairs:
-        if not asker or not answerer:
-            continue
-        graph.AddEdge(asker, answerer)
-
-    return graph
-
+    nodes = None
+    if not active:
+        nodes = np.fromiter(search_utilities.users_above_threshold(cursor, 0), dtype=np.int64)
+    return qa_relations(cursor).graph(relations, timebin, directed, nodes)
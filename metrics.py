@@ -49,6 +49,32 @@ def percentile_normalization(userID, cur, sampling_percentiles):
             times.append(posts[x-1])
     return times   
 
+def percentile_normalization_batch(userIDs, cur, sampling_percentiles):
+    """same as percentile_normalization for many users at once, with two queries in total.
+       Returns {userID: vector of end times}"""
+    userIDs = tuple(set(userIDs))
+    if not userIDs:
+        return {}
+    query1 = "select id, creation_date from se_user where id in %(ids)s"
+    cur.execute(query1, {'ids': userIDs})
+    starts = dict(results(cur))
+    query2 = "select owner_user_id, creation_date from post where owner_user_id in %(ids)s and (post_type_id = 1 or post_type_id = 2) order by owner_user_id, creation_date"
+    cur.execute(query2, {'ids': userIDs})
+    posts = dict((userID, []) for userID in userIDs)
+    for userID, creation_date in results(cur):
+        posts[userID].append(creation_date)
+    normalized = {}
+    for userID in userIDs:
+        times = []
+        for p in sampling_percentiles:
+            x = int(len(posts[userID]) * p)
+            if x == 0:
+                times.append(starts[userID])
+            else:
+                times.append(posts[userID][x-1])
+        normalized[userID] = times
+    return normalized
+
 def total_answers_helper(cur, start_time, end_time, userID):
     query = "select count(*) from post where owner_user_id = %(id)s and post_type_id = 2 and creation_date >= %(start_time)s and creation_date <= %(end_time)s"
     cur.execute(query, {'start_time': start_time, 'end_time': end_time, 'id': userID})
@@ -105,44 +131,65 @@ def get_cau_at_time(cur, conn, userID, time):
 def get_elo_at_time(cur, conn, userID, time):
     return elo.elo(cur, conn, userID, time)
 
-def cau_for_user(cur, conn, userID, samples = None):
+def _cached(store, metric, userID, samples, compute):
+    """Looks a metric series up in a feature_store.FeatureStore,
+       computing it on a miss. Without a store it is always computed."""
+    if store is None:
+        return compute()
+    return store.fetch(metric, userID, samples, compute)
+
+def cau_for_user(cur, conn, userID, samples = None, store = None):
     if not samples:
         samples = percentiles
-    times = percentile_normalization(userID, cur, samples)
-    return [get_cau_at_time(cur, conn, userID, t) for t in times]
+    def compute():
+        times = percentile_normalization(userID, cur, samples)
+        return [get_cau_at_time(cur, conn, userID, t) for t in times]
+    return _cached(store, 'cau', userID, samples, compute)
 
-def elo_for_user(cur, conn, userID, samples = None):
+def elo_for_user(cur, conn, userID, samples = None, store = None):
     if not samples:
         samples = percentiles
-    times = percentile_normalization(userID, cur, samples)
-    return [get_elo_at_time(cur, conn, userID, t) for t in times]
+    def compute():
+        times = percentile_normalization(userID, cur, samples)
+        return [get_elo_at_time(cur, conn, userID, t) for t in times]
+    return _cached(store, 'elo', userID, samples, compute)
 
-def pagerank_for_user(cur, userID, samples = None):
+def pagerank_for_user(cur, userID, samples = None, store = None):
     if not samples:
         samples = percentiles
-    times = percentile_normalization(userID, cur, samples)
-    return [get_pagerank_at_time(cur, userID, t) for t in times]
+    def compute():
+        times = percentile_normalization(userID, cur, samples)
+        return [get_pagerank_at_time(cur, userID, t) for t in times]
+    return _cached(store, 'pagerank', userID, samples, compute)
 
-def auth_for_user(cur, userID, samples = None):
+def auth_for_user(cur, userID, samples = None, store = None):
     if not samples:
         samples = percentiles
-    times = percentile_normalization(userID, cur, samples)
-    return [get_auth_at_time(cur, userID, t) for t in times]
+    def compute():
+        times = percentile_normalization(userID, cur, samples)
+        return [get_auth_at_time(cur, userID, t) for t in times]
+    return _cached(store, 'auth', userID, samples, compute)
 
-def indegree_for_user(cur, userID, samples = None):
+def indegree_for_user(cur, userID, samples = None, store = None):
     if not samples:
         samples = percentiles
-    times = percentile_normalization(userID, cur, samples)
-    return [get_indegree_at_time(cur, userID, t) for t in times]
+    def compute():
+        times = percentile_normalization(userID, cur, samples)
+        return [get_indegree_at_time(cur, userID, t) for t in times]
+    return _cached(store, 'indegree', userID, samples, compute)
 
-def betweenness_for_user(cur, userID, samples = None):
+def betweenness_for_user(cur, userID, samples = None, store = None):
     if not samples:
         samples = percentiles
-    times = percentile_normalization(userID, cur, samples)
-    return [get_betweenness_at_time(cur, userID, t) for t in times]
+    def compute():
+        times = percentile_normalization(userID, cur, samples)
+        return [get_betweenness_at_time(cur, userID, t) for t in times]
+    return _cached(store, 'betweenness', userID, samples, compute)
 
-def closeness_for_user(cur, userID, samples = None):
+def closeness_for_user(cur, userID, samples = None, store = None):
     if not samples:
         samples = percentiles
-    times = percentile_normalization(userID, cur, samples)
-    return [get_closeness_at_time(cur, userID, t) for t in times]
\ No newline at end of file
+    def compute():
+        times = percentile_normalization(userID, cur, samples)
+        return [get_closeness_at_time(cur, userID, t) for t in times]
+    return _cached(store, 'closeness', userID, samples, compute)
\ No newline at end of file
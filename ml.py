@@ -1,8 +1,12 @@
 from __future__ import division
+import multiprocessing
 import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.decomposition import PCA
-from sklearn.linear_model import LogisticRegression, LogisticRegressionCV
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.linear_model import LogisticRegression, LogisticRegressionCV, SGDClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import RepeatedStratifiedKFold
 
 
 def plot_pca(samples, labels):
@@ -28,30 +32,35 @@ def plot_pca(samples, labels):
     plt.show()
 
 
-def logistic_test(train_data, train_labels, test_data, test_labels, cv=False):
-    # Perform logistic regression.
-    clf = LogisticRegressionCV() if cv else LogisticRegression()
-    clf.fit(train_data, train_labels)
-    predicted_labels = clf.predict(test_data)
+def confusion(predicted_labels, actual_labels):
+    """
+    Returns (tp, tn, fp, fn) counts for binary labels.
+    """
+    predicted = np.asarray(predicted_labels) == 1
+    actual = np.asarray(actual_labels) == 1
+    tp = int(np.count_nonzero(predicted & actual))
+    tn = int(np.count_nonzero(~predicted & ~actual))
+    fp = int(np.count_nonzero(predicted & ~actual))
+    fn = int(np.count_nonzero(~predicted & actual))
+    return tp, tn, fp, fn
 
-    # Count true positives, true negatives, false positives, false negatives.
-    tp, tn, fp, fn = 0, 0, 0, 0
-    for predicted, actual in zip(predicted_labels, test_labels):
-        if predicted == 1 and actual == 1:
-            tp += 1
-        if predicted == 0 and actual == 0:
-            tn += 1
-        if predicted == 1 and actual == 0:
-            fp += 1
-        if predicted == 0 and actual == 1:
-            fn += 1
-
-    # Compute statistics. 
-    accuracy =  (tp + tn) / (tp + tn + fp +fn)
+
+def statistics(tp, tn, fp, fn):
+    """
+    Returns (accuracy, precision, recall) for confusion counts.
+    """
+    accuracy = 0 if (tp + tn + fp + fn) == 0 else (tp + tn) / (tp + tn + fp + fn)
     precision = 0 if (tp + fp) == 0 else tp / (tp + fp)
     recall = 0 if (tp + fn) == 0 else tp / (tp + fn)
+    return accuracy, precision, recall
 
-    # Print report.
+
+def report(tp, tn, fp, fn):
+    """
+    Prints accuracy, precision, recall and the confusion counts,
+    and returns the accuracy.
+    """
+    accuracy, precision, recall = statistics(tp, tn, fp, fn)
     print "Correctly classified {}/{}".format(tp + tn, tp + tn + fp +fn)
     print "Accuracy:", accuracy
     print "Precision:", precision
@@ -59,3 +68,191 @@ def logistic_test(train_data, train_labels, test_data, test_labels, cv=False):
     print "tp: {}; tn: {}; fp: {}; fn {}".format(tp, tn, fp, fn)
 
     return accuracy
+
+
+def logistic_test(train_data, train_labels, test_data, test_labels, cv=False):
+    # Perform logistic regression.
+    clf = LogisticRegressionCV() if cv else LogisticRegression()
+    clf.fit(train_data, train_labels)
+    predicted_labels = clf.predict(test_data)
+
+    # Count true positives, true negatives, false positives, false negatives.
+    tp, tn, fp, fn = confusion(predicted_labels, test_labels)
+
+    return report(tp, tn, fp, fn)
+
+
+# The streaming versions below never hold more than one chunk of the
+# training set in memory. |chunk_source| is a function of no arguments
+# returning a fresh iterable of (data, labels) chunks, e.g.
+#     lambda: feature_matrix.chunks("cache/cooking/matrix")
+# so the data can be streamed more than once.
+
+
+def streaming_logistic(chunk_source, epochs=5, alpha=0.0001, seed=0):
+    """
+    Fits SGD-based logistic regression incrementally. One pass
+    collects feature means and variances for scaling, then
+    |epochs| passes update the model chunk by chunk.
+
+    Returns a fitted pipeline usable like LogisticRegression.
+    """
+    scaler = StandardScaler()
+    for data, labels in chunk_source():
+        scaler.partial_fit(data)
+
+    clf = SGDClassifier(loss='log', alpha=alpha, random_state=seed)
+    for epoch in range(epochs):
+        for data, labels in chunk_source():
+            clf.partial_fit(scaler.transform(data), labels, classes=[0, 1])
+    return make_pipeline(scaler, clf)
+
+
+def streaming_test(model, chunk_source):
+    """
+    Same report as logistic_test for a fitted model, with the
+    test set streamed in chunks.
+    """
+    counts = np.zeros(4, dtype=np.int64)
+    for data, labels in chunk_source():
+        counts += confusion(model.predict(data), labels)
+    tp, tn, fp, fn = [int(c) for c in counts]
+    return report(tp, tn, fp, fn)
+
+
+def streaming_pca(chunk_source, n_components=2):
+    """
+    Fits PCA incrementally, one chunk at a time. partial_fit needs
+    at least n_components rows per call, so each chunk is held back
+    until the next one arrives and chunks shorter than that, such as
+    a trailing partial chunk, are merged into the one before them.
+    """
+    pca = IncrementalPCA(n_components=n_components)
+    pending = None
+    for data, labels in chunk_source():
+        if len(data) == 0:
+            continue
+        if pending is None:
+            pending = data
+        elif len(data) < n_components or len(pending) < n_components:
+            pending = np.concatenate((pending, data))
+        else:
+            pca.partial_fit(pending)
+            pending = data
+    if pending is not None:
+        pca.partial_fit(pending)
+    return pca
+
+
+def plot_pca_streaming(chunk_source):
+    """
+    Same plot as plot_pca, with the samples streamed in chunks.
+    """
+    pca = streaming_pca(chunk_source)
+
+    plt.xscale("log")
+    plt.yscale("log")
+
+    negative, positive = None, None
+    for data, labels in chunk_source():
+        points = pca.transform(data)
+        labels = np.asarray(labels)
+        negative = plt.scatter(points[labels == 0, 0], points[labels == 0, 1], color='blue', alpha=.5)
+        positive = plt.scatter(points[labels == 1, 0], points[labels == 1, 1], color='red', alpha=.5)
+
+    legend_points = (negative, positive)
+    legend_labels = ('Non-expert', 'Expert')
+
+    plt.legend(legend_points, legend_labels)
+
+    plt.show()
+
+
+# Feature matrix shared with grid workers. It is set before the
+# pool forks so workers read the parent's (possibly memory-mapped)
+# matrix instead of each receiving a pickled copy.
+_grid = {}
+
+
+def _evaluate_cell(cell):
+    columns, C, splits = cell
+    data = _grid['data']
+    labels = _grid['labels']
+    counts = np.zeros(4, dtype=np.int64)
+    accuracies = []
+    for train, test in splits:
+        clf = LogisticRegression(C=C)
+        clf.fit(data[np.ix_(train, columns)], labels[train])
+        split_counts = confusion(clf.predict(data[np.ix_(test, columns)]), labels[test])
+        counts += split_counts
+        accuracies.append(statistics(*split_counts)[0])
+    return counts, np.mean(accuracies), np.std(accuracies)
+
+
+def evaluation_grid(data, labels, columns, families, windows, Cs=(1.0,),
+                    folds=5, repeats=3, processes=None, seed=0):
+    """
+    Cross-validates logistic regression over every combination of
+    feature families, percentile windows and regularization values,
+    spreading the combinations across a pool of worker processes.
+
+    :param data: feature matrix, one row per user
+    :param labels: expert (1) / nonexpert (0) label per row
+    :param columns: (metric, percentile) describing each column of data,
+                    e.g. feature_pipeline.feature_columns(specs)
+    :param families: list of tuples of metrics to combine, e.g. [('elo',), ('elo', 'cau')]
+    :param windows: list of tuples of percentiles to keep, e.g. [(.1,), (.1, .2, .3)]
+    :param Cs: inverse regularization strengths
+    :param folds: number of stratified CV folds
+    :param repeats: number of times CV is repeated with a different shuffle
+    :param processes: number of workers, defaults to the number of cores
+    :param seed: seed for the CV shuffles, so runs are reproducible
+
+    Returns a list of dicts with the settings and the pooled
+    confusion counts and statistics, one per combination.
+    """
+    labels = np.asarray(labels)
+    cv = RepeatedStratifiedKFold(n_splits=folds, n_repeats=repeats, random_state=seed)
+    splits = list(cv.split(np.zeros(len(labels)), labels))
+
+    settings = []
+    cells = []
+    for family in families:
+        for window in windows:
+            selected = [i for i, (metric, p) in enumerate(columns)
+                        if metric in family and p in window]
+            if not selected:
+                continue
+            for C in Cs:
+                settings.append((family, window, C))
+                cells.append((selected, C, splits))
+
+    _grid['data'] = data
+    _grid['labels'] = labels
+    pool = multiprocessing.Pool(processes)
+    try:
+        outcomes = pool.map(_evaluate_cell, cells)
+    finally:
+        pool.close()
+        pool.join()
+        _grid.clear()
+
+    results = []
+    for (family, window, C), (counts, mean_accuracy, std_accuracy) in zip(settings, outcomes):
+        tp, tn, fp, fn = [int(c) for c in counts]
+        accuracy, precision, recall = statistics(tp, tn, fp, fn)
+        results.append({'families': family, 'window': window, 'C': C,
+                        'accuracy': accuracy, 'accuracy_std': std_accuracy,
+                        'precision': precision, 'recall': recall,
+                        'tp': tp, 'tn': tn, 'fp': fp, 'fn': fn})
+    return results
+
+
+def print_grid(results):
+    """
+    Prints evaluation_grid results, best accuracy first.
+    """
+    for r in sorted(results, key=lambda r: r['accuracy'], reverse=True):
+        print "{:<20} {:<24} C={:<8g} acc={:.3f}+-{:.3f} prec={:.3f} rec={:.3f}".format(
+            "+".join(r['families']), ",".join("%g" % p for p in r['window']), r['C'],
+            r['accuracy'], r['accuracy_std'], r['precision'], r['recall'])
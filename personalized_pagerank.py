@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+Personalized PageRank from a seed set, e.g. the known experts in
+search_utilities.get_experts, as a measure of how close other users
+get to them.
+
+Instead of power iteration over the whole graph, scores come from
+the local push method of Andersen, Chung and Lang. Every node holds
+an estimate and a residual. The seeds start out holding all the
+residual, and a node pushes once its residual reaches |tolerance|
+times its degree: it keeps |alpha| of the residual as score and
+spreads the rest over its neighbours. Only nodes reached by such
+pushes are ever touched, so the cost depends on the neighbourhood of
+the seeds and the tolerance, not on the size of the site.
+
+    graph = graph2.build_graph_before(cur, cutoff)
+    scores = expert_proximity(graph, user_ids)
+"""
+
+from collections import deque
+import search_utilities
+
+def personalized_pagerank(graph, seeds, alpha = 0.15, tolerance = 1e-6, reverse = False):
+    """
+    Returns {user_id: score} approximating the personalized PageRank
+    of every node reached from the seeds. Nodes that are not returned
+    have score 0. Scores never exceed the exact values, and together
+    they fall short by the residual left when pushing stops, which is
+    below |tolerance| times the degree at every node.
+
+    Teleports go back to the seeds, spread evenly, and so does the
+    walk from a node without neighbours.
+
+    :param graph: a SNAP TNGraph or TUNGraph
+    :param seeds: user ids to personalize on; ids not in the graph
+        are ignored
+    :param alpha: teleport probability
+    :param tolerance: residual per unit degree below which a node
+        stops pushing
+    :param reverse: walk edges backwards, i.e. along in-edges
+    """
+    seeds = [seed for seed in set(seeds) if graph.IsNode(seed)]
+    if not seeds:
+        return {}
+    start = 1.0 / len(seeds)
+
+    def neighbours(node):
+        if reverse:
+            return [node.GetInNId(i) for i in range(node.GetInDeg())]
+        return [node.GetOutNId(i) for i in range(node.GetOutDeg())]
+
+    scores = {}
+    residual = dict((seed, start) for seed in seeds)
+    degree = {}
+    queue = deque(seeds)
+    queued = set(seeds)
+    while queue:
+        user_id = queue.popleft()
+        queued.discard(user_id)
+        if user_id not in degree:
+            degree[user_id] = neighbours(graph.GetNI(user_id))
+        targets = degree[user_id]
+        mass = residual.pop(user_id, 0.0)
+        if mass < tolerance * max(len(targets), 1):
+            if mass:
+                residual[user_id] = mass
+            continue
+
+        scores[user_id] = scores.get(user_id, 0.0) + alpha * mass
+        if targets:
+            share = (1 - alpha) * mass / len(targets)
+        else:
+            targets = seeds
+            share = (1 - alpha) * mass * start
+        for target in targets:
+            residual[target] = residual.get(target, 0.0) + share
+            if target not in queued:
+                if target not in degree:
+                    degree[target] = neighbours(graph.GetNI(target))
+                if residual[target] >= tolerance * max(len(degree[target]), 1):
+                    queue.append(target)
+                    queued.add(target)
+    return scores
+
+def expert_proximity(graph, user_ids, experts = None, alpha = 0.15, tolerance = 1e-6, reverse = False):
+    """
+    Returns {user_id: score} with the personalized PageRank of each
+    of the given users, seeded from the experts. Users the push
+    never reaches score 0.
+
+    :param graph: a SNAP TNGraph or TUNGraph
+    :param user_ids: the users to score
+    :param experts: the seed set, search_utilities.get_experts() by default
+    :param alpha: teleport probability
+    :param tolerance: residual per unit degree below which a node
+        stops pushing
+    :param reverse: walk edges backwards, i.e. along in-edges
+    """
+    if experts is None:
+        experts = search_utilities.get_experts()
+    scores = personalized_pagerank(graph, experts, alpha, tolerance, reverse)
+    return dict((user_id, scores.get(user_id, 0.0)) for user_id in user_ids)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""
+Top-k selection and per-user rank lookups over metric arrays, such as
+the ones graph2.pagerank_vector and graph2.hits_vectors return.
+
+top_k uses partial selection, so it costs O(n + k log k) rather than a
+full sort. RankTable sorts each snapshot once and then answers "rank of
+user u at every cutoff" and "top k at every cutoff" without touching
+the other users:
+
+    table = RankTable(index, [graph2.pagerank_vector(g, index) for g in graphs])
+    table.rank_of(user_id)      # rank at every snapshot, 1 = highest
+    table.top(100)              # (snapshots x 100) array of user ids
+
+Ties are broken by user id, lowest first.
+"""
+
+import numpy as np
+
+def top_k(values, k):
+    """
+    Returns the positions of the k largest values, largest first.
+
+    :param values: 1-d array of scores
+    :param k: number of positions to return
+    """
+    values = np.asarray(values)
+    k = min(k, len(values))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(values):
+        # The k-th largest value, found by partial selection. Of the
+        # values tied with it, the ones at the lowest positions make it.
+        threshold = -np.partition(-values, k - 1)[k - 1]
+        above = np.flatnonzero(values > threshold)
+        tied = np.flatnonzero(values == threshold)[:k - len(above)]
+        candidates = np.concatenate((above, tied))
+    else:
+        candidates = np.arange(len(values))
+    # Only the k selected values get sorted, breaking ties by position.
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order]
+
+def top_k_users(index, values, k):
+    """
+    Returns [(user_id, score)] for the k highest-scoring users.
+
+    :param index: the user_index.UserIndex |values| is aligned with
+    :param values: array of scores aligned with the index
+    :param k: number of users to return
+    """
+    values = np.asarray(values)
+    top = top_k(values, k)
+    return zip(index.ids[top].tolist(), values[top].tolist())
+
+def ranks(values):
+    """
+    Returns the rank of every entry, 1 for the highest value.
+
+    :param values: 1-d array of scores
+    """
+    values = np.asarray(values)
+    order = np.argsort(-values, kind='mergesort')
+    result = np.empty(len(values), dtype=np.int64)
+    result[order] = np.arange(1, len(values) + 1)
+    return result
+
+class RankTable(object):
+    """
+    The ranking of every user in every snapshot.
+
+    order - (snapshots x users) dense user indices, best first
+    ranks - (snapshots x users) rank of each user, 1 = highest
+    """
+
+    def __init__(self, index, scores):
+        """
+        :param index: a user_index.UserIndex
+        :param scores: one array of scores aligned with the index
+            per snapshot, e.g. graph2.pagerank_vector at each cutoff
+        """
+        self.index = index
+        scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+        snapshots, users = scores.shape
+        self.order = np.argsort(-scores, axis=1, kind='mergesort')
+        self.ranks = np.empty((snapshots, users), dtype=np.int64)
+        rows = np.arange(snapshots)[:, np.newaxis]
+        self.ranks[rows, self.order] = np.arange(1, users + 1)
+
+    def __len__(self):
+        return len(self.order)
+
+    def rank_of(self, user_id):
+        """
+        Returns the user's rank in every snapshot.
+
+        :param user_id: the user id
+        """
+        return self.ranks[:, self.index.index(user_id)]
+
+    def ranks_of(self, user_ids):
+        """
+        Returns a (snapshots x len(user_ids)) array of ranks. Unknown
+        users get rank 0.
+
+        :param user_ids: a sequence of user ids
+        """
+        columns = self.index.indices(user_ids)
+        result = self.ranks[:, columns.clip(0)]
+        result[:, columns < 0] = 0
+        return result
+
+    def top(self, k):
+        """
+        Returns a (snapshots x k) array with the ids of the k
+        highest-ranked users in every snapshot, best first.
+
+        :param k: number of users per snapshot
+        """
+        return self.index.ids[self.order[:, :k]]
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+Headless rendering for scatter plots too large to draw one marker at a
+time. Points are binned into a 2D density grid with numpy (log-spaced
+bins on log axes) and the grid is drawn as a single image.
+
+Figures are described by plain dicts so they can be rendered in
+parallel worker processes:
+
+    {'path': 'output/expert_elo.png', 'x': ..., 'y': ...,
+     'xlog': False, 'ylog': False, 'title': ..., 'xlabel': ..., 'ylabel': ...}
+
+A hash of each figure's inputs is kept next to the image, and figures
+whose inputs have not changed since the last run are skipped.
+"""
+
+from __future__ import division
+import os
+import hashlib
+import multiprocessing
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LogNorm
+
+OUTPUT_DIR = "output"
+
+# Above this many points scatter() switches to a density grid.
+MAX_MARKERS = 10000
+
+def _edges(values, bins, log):
+    if log:
+        return np.logspace(np.log10(values.min()), np.log10(values.max()), bins + 1)
+    return np.linspace(values.min(), values.max(), bins + 1)
+
+def density_grid(x, y, bins = 200, xlog = False, ylog = False):
+    """
+    Returns (counts, xedges, yedges) binning the points into a
+    bins x bins grid. On log axes the bins are log-spaced and
+    non-positive values, which can't be shown, are dropped.
+
+    :param x: x coordinates
+    :param y: y coordinates
+    :param bins: number of bins along each axis
+    :param xlog: log-space the x bins
+    :param ylog: log-space the y bins
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    if xlog:
+        keep &= x > 0
+    if ylog:
+        keep &= y > 0
+    x = x[keep]
+    y = y[keep]
+    if len(x) == 0:
+        return np.zeros((bins, bins)), np.arange(bins + 1.0), np.arange(bins + 1.0)
+    counts, xedges, yedges = np.histogram2d(x, y, bins=(_edges(x, bins, xlog), _edges(y, bins, ylog)))
+    return counts, xedges, yedges
+
+def plot_density(ax, x, y, bins = 200, xlog = False, ylog = False, cmap = 'viridis'):
+    """
+    Draws the density grid of the points on a matplotlib axes.
+    """
+    counts, xedges, yedges = density_grid(x, y, bins, xlog, ylog)
+    if xlog:
+        ax.set_xscale('log')
+    if ylog:
+        ax.set_yscale('log')
+    # Empty cells are masked so they show as background.
+    counts = np.ma.masked_equal(counts.T, 0)
+    mesh = ax.pcolormesh(xedges, yedges, counts, cmap=cmap,
+                         norm=LogNorm() if counts.count() else None, rasterized=True)
+    return mesh
+
+def scatter(ax, x, y, xlog = False, ylog = False, color = 'blue', label = None, bins = 200):
+    """
+    Draws a scatter plot, switching to a density grid when there
+    are more than MAX_MARKERS points.
+    """
+    if len(x) > MAX_MARKERS:
+        return plot_density(ax, x, y, bins, xlog, ylog)
+    if xlog:
+        ax.set_xscale('log')
+    if ylog:
+        ax.set_yscale('log')
+    return ax.scatter(x, y, color=color, label=label)
+
+def _digest(spec):
+    h = hashlib.sha1()
+    for key in sorted(spec):
+        value = spec[key]
+        h.update(key)
+        if isinstance(value, np.ndarray) or isinstance(value, list):
+            h.update(np.ascontiguousarray(value, dtype=np.float64).tostring())
+        else:
+            h.update(repr(value))
+    return h.hexdigest()
+
+def render_figure(spec, force = False):
+    """
+    Renders one figure spec to its path without going through
+    pyplot, so no display is needed. Returns False if the figure
+    was skipped because its inputs have not changed.
+
+    :param spec: figure description, see the module docstring
+    :param force: render even if the inputs are unchanged
+    """
+    path = spec['path']
+    stamp_path = path + ".inputs"
+    digest = _digest(spec)
+    if not force and os.path.exists(path) and os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if f.read().strip() == digest:
+                return False
+
+    fig = Figure(figsize=spec.get('figsize', (8, 6)))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    artist = scatter(ax, spec['x'], spec['y'], spec.get('xlog', False), spec.get('ylog', False),
+                     spec.get('color', 'blue'), bins=spec.get('bins', 200))
+    if len(spec['x']) > MAX_MARKERS:
+        fig.colorbar(artist, ax=ax, label='Points')
+    if 'title' in spec:
+        fig.suptitle(spec['title'])
+    if 'xlabel' in spec:
+        ax.set_xlabel(spec['xlabel'])
+    if 'ylabel' in spec:
+        ax.set_ylabel(spec['ylabel'])
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    fig.savefig(path)
+    with open(stamp_path, 'w') as f:
+        f.write(digest)
+    return True
+
+def _render_job(job):
+    spec, force = job
+    return render_figure(spec, force)
+
+def render_figures(specs, processes = None, force = False):
+    """
+    Renders many figure specs in parallel. Returns the paths of
+    the figures that were actually (re)drawn.
+
+    :param specs: list of figure descriptions
+    :param processes: number of workers, defaults to the number of cores
+    :param force: render even if the inputs are unchanged
+    """
+    pool = multiprocessing.Pool(processes)
+    try:
+        rendered = pool.map(_render_job, [(spec, force) for spec in specs])
+    finally:
+        pool.close()
+        pool.join()
+    return [spec['path'] for spec, drawn in zip(specs, rendered) if drawn]
@@ -5,6 +5,8 @@ from collections import Counter
 import psycopg2
 import matplotlib.pyplot as plt
 import numpy as np
+import rendering
+import search_utilities
 
 DB_NAME = "cooking"
 DB_USER = "Ben-han"
@@ -29,13 +31,26 @@ def get_reputation(cur):
     return [i[0] for i in results(cur)]
         
 
+def render_reputation(reputation, path = "output/reputation_by_rank.png"):
+    """Renders every user's reputation against their rank headless,
+       as a density grid once there are too many users to draw."""
+    reputation = np.sort(np.asarray(reputation, dtype=np.float64))[::-1]
+    rank = np.arange(1, len(reputation) + 1)
+    return rendering.render_figure({'path': path, 'x': rank, 'y': reputation + 1,
+                                    'xlog': True, 'ylog': True,
+                                    'title': 'Reputation by rank',
+                                    'xlabel': 'Rank', 'ylabel': 'Reputation + 1'})
+
 def main():
     conn, cur = connect()
-    reputation = get_reputation(cur)
+    render_reputation(get_reputation(cur))
 
     bin_width = 100
-    rounded_rep = [(i//bin_width)*bin_width for i in reputation]
-    counts = Counter(rounded_rep)
+    cur.execute("SELECT MAX(reputation) FROM se_user;")
+    edges = np.arange(0, cur.fetchone()[0] + bin_width + 1, bin_width)
+    edges, counts = search_utilities.reputation_histogram(cur, edges=edges)
+
+    counts = Counter(dict((int(e), int(c)) for e, c in zip(edges, counts) if c))
 
     print counts
     plt.xscale('log')
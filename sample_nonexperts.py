@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import random
 import psycopg2
 import numpy as np
 import search_utilities
@@ -37,6 +38,81 @@ def sample(cur, sample_size = 50):
     cur.execute(query1, {"experts": experts, "limit": sample_size})
     return list(result[0] for result in cur)
 
+def stratified_sample(cur, sample_size = 50, seed = 0, activity_edges = (2, 5, 20, 100),
+                      reputation_edges = (10, 100, 1000, 10000), allocation = 'proportional'):
+    """Samples active non-experts (more than one answer) stratified by activity level
+       and reputation band, without sorting the population by random(). Users are
+       drawn from a repeatable TABLESAMPLE of se_user, which is widened until it
+       holds enough candidates, and their reputations come back in the same query.
+
+       Returns a list of (user id, reputation). The same seed on the same data gives
+       the same sample.
+
+       activity_edges / reputation_edges: lower edges of the answer count and
+       reputation bands. allocation: 'proportional' to the stratum sizes or 'equal'."""
+    experts = list(search_utilities.get_experts())
+    cur.execute("SELECT reltuples FROM pg_class WHERE relname = 'se_user';")
+    estimate = max(cur.fetchone()[0], 1)
+
+    query = """SELECT u.id, u.reputation,
+                      width_bucket(COUNT(*)::double precision, %(activity)s::double precision[]),
+                      width_bucket(u.reputation::double precision, %(reputation)s::double precision[])
+               FROM se_user u TABLESAMPLE BERNOULLI (%(percent)s) REPEATABLE (%(seed)s)
+               INNER JOIN post p
+               ON p.owner_user_id = u.id
+               WHERE u.id <> -1
+               AND NOT (u.id = ANY(%(experts)s))
+               AND p.post_type_id = 2
+               GROUP BY u.id, u.reputation HAVING Count(*) > 1;"""
+
+    # Start by sampling enough of the table to expect a few times the
+    # sample size, and widen the sample until there are enough candidates.
+    percent = min(100.0, 400.0 * sample_size / estimate)
+    while True:
+        cur.execute(query, {"activity": list(activity_edges), "reputation": list(reputation_edges),
+                            "percent": percent, "seed": seed, "experts": experts})
+        candidates = sorted(cur.fetchall())
+        if len(candidates) >= sample_size or percent >= 100.0:
+            break
+        percent = min(100.0, percent * 4)
+
+    strata = {}
+    for user_id, reputation, activity_band, reputation_band in candidates:
+        strata.setdefault((activity_band, reputation_band), []).append((user_id, reputation))
+    keys = sorted(strata)
+    quotas = _allocate(sample_size, [len(strata[k]) for k in keys], allocation)
+
+    rng = random.Random(seed)
+    sampled = []
+    for key, quota in zip(keys, quotas):
+        sampled += rng.sample(strata[key], quota)
+    return sampled
+
+def _allocate(sample_size, sizes, allocation):
+    """Splits sample_size across strata of the given sizes, never asking a stratum
+       for more users than it has."""
+    quotas = [0] * len(sizes)
+    remaining = min(sample_size, sum(sizes))
+    open_strata = [i for i, size in enumerate(sizes) if size > 0]
+    while remaining > 0 and open_strata:
+        if allocation == 'equal':
+            weights = [1.0] * len(open_strata)
+        else:
+            weights = [float(sizes[i] - quotas[i]) for i in open_strata]
+        total = sum(weights)
+        shares = [remaining * w / total for w in weights]
+        # Largest remainder rounding, so the quotas add up to |remaining|.
+        floors = [int(share) for share in shares]
+        order = sorted(range(len(shares)), key=lambda j: shares[j] - floors[j], reverse=True)
+        for j in order[:remaining - sum(floors)]:
+            floors[j] += 1
+        for j, i in enumerate(open_strata):
+            take = min(floors[j], sizes[i] - quotas[i])
+            quotas[i] += take
+            remaining -= take
+        open_strata = [i for i in open_strata if quotas[i] < sizes[i]]
+    return quotas
+
 def view_reputations(sample, cur):
     reputations = []
     for user in sample:
@@ -48,9 +124,10 @@ def view_reputations(sample, cur):
 
 def main():
     conn, cur = connect()
-    nonexperts = sample(cur)
+    sampled = stratified_sample(cur)
+    nonexperts = [user_id for user_id, reputation in sampled]
     print nonexperts
-    reputations = view_reputations(nonexperts, cur)
+    reputations = [reputation for user_id, reputation in sampled]
     print reputations
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@
 
 from collections import namedtuple
 from datetime import date, datetime
+import numpy as np
 
 # Time bins are a tuple (start, end) denoting
 # the start and end dates of a time range,
@@ -128,6 +129,44 @@ def count_users_by_reputation(cursor):
     cursor.execute(query)
     return ((result[0], result[1]) for result in cursor)
 
+def reputation_histogram(cursor, bins = 50, log = False, edges = None):
+    """
+    Returns (edges, counts) for a histogram of user reputation,
+    binned by the database with width_bucket so that only the
+    bin counts are transferred. counts[i] is the number of users
+    with edges[i] <= reputation < edges[i + 1].
+
+    :param cursor: a Postgres database cursor
+    :param bins: number of bins when edges are not given
+    :param log: space the bins logarithmically instead of linearly
+    :param edges: explicit, increasing bin edges
+    """
+    if edges is None:
+        cursor.execute("SELECT MIN(reputation), MAX(reputation) FROM se_user WHERE id >= 0;")
+        low, high = cursor.fetchone()
+        if low is None:
+            return np.zeros(bins + 1), np.zeros(bins, dtype=np.int64)
+        # The top edge is exclusive, so nudge it past the maximum.
+        if log:
+            edges = np.logspace(np.log10(max(low, 1)), np.log10(high + 1), bins + 1)
+        else:
+            edges = np.linspace(low, high + 1, bins + 1)
+    edges = np.asarray(edges, dtype=np.float64)
+
+    query = """SELECT width_bucket(reputation::double precision, %(edges)s::double precision[]) AS bucket,
+                      COUNT(*)
+               FROM se_user
+               WHERE id >= 0
+               GROUP BY bucket;
+            """
+    cursor.execute(query, {'edges': edges.tolist()})
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    for bucket, count in cursor:
+        # Bucket 0 is below the first edge, len(edges) past the last.
+        if 1 <= bucket < len(edges):
+            counts[bucket - 1] = count
+    return edges, counts
+
 def users_above_threshold(cursor, threshold):
   	"""
   	Returns a generator for IDs for users with 
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+Answerer -> asker graphs over a sliding time window.
+
+Instead of rebuilding a graph for every window, SlidingWindow keeps one
+window's state and moves it forward a step at a time. Each step adds
+the cached edges that have just entered the window and removes the ones
+that have aged out, and in- and out-degrees are updated from those edges
+alone. PageRank is warm-started from the previous window's scores, so
+when consecutive windows overlap heavily it converges in a few
+iterations.
+
+    edges = edge_cache.load_edge_cache(cur, conn)
+    index = user_index.user_index(cur, conn)
+    for w in SlidingWindow(edges, index, timedelta(days=90), timedelta(days=7)):
+        print w.start, w.end, w.outdeg.mean(), w.pagerank()[:10]
+
+An edge is in the window (start, end) when both its question and its
+answer were posted strictly inside it, as in EdgeCache.select, and
+the graph holds each distinct answerer -> asker pair once. Nodes are
+every user in the UserIndex, so per-user state is a flat array
+aligned with it.
+"""
+
+from __future__ import division
+import numpy as np
+import snap
+import edge_cache
+import graph2
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+class SlidingWindow(object):
+    """
+    The state of one window position. Iterating moves the window
+    forward by |step| and yields the window after each move.
+
+    start, end - the current window bounds, as numpy datetime64
+    outdeg     - distinct out-neighbours of each user, aligned with
+                 the UserIndex
+    indeg      - distinct in-neighbours of each user
+    """
+
+    def __init__(self, edges, index, window, step, start = None, end = None, mask = None,
+                 damping = 0.85, tolerance = 1e-4, max_iter = 100):
+        """
+        :param edges: an edge_cache.EdgeCache
+        :param index: a user_index.UserIndex giving the node set
+        :param window: window length, a timedelta
+        :param step: how far each move advances the window, a timedelta
+        :param start: start of the first window, defaults to just
+            before the earliest edge
+        :param end: stop once the window start passes this date,
+            defaults to the latest edge
+        :param mask: optional EdgeCache.select mask restricting the edges
+        :param damping: PageRank damping factor
+        :param tolerance: PageRank stops when the L1 change drops below this
+        :param max_iter: PageRank iteration limit
+        """
+        self.index = index
+        self.window = _microseconds(window)
+        self.step = _microseconds(step)
+        if self.window <= 0 or self.step <= 0:
+            raise ValueError("Window length and step must be positive")
+        self.damping = damping
+        self.tolerance = tolerance
+        self.max_iter = max_iter
+
+        src = index.indices(edges.answerer)
+        dst = index.indices(edges.asker)
+        keep = (src >= 0) & (dst >= 0)
+        if mask is not None:
+            keep &= mask
+        src = src[keep]
+        dst = dst[keep]
+        self._first = np.minimum(edges.answer_time[keep], edges.question_time[keep])
+        self._last = np.maximum(edges.answer_time[keep], edges.question_time[keep])
+
+        # Every edge maps onto a distinct (src, dst) pair. The window
+        # keeps a count of live edges per pair; a pair is in the graph
+        # while its count is positive.
+        n = len(index)
+        pairs, self._pair = np.unique(src * n + dst, return_inverse=True)
+        self._pair_src = pairs // n
+        self._pair_dst = pairs % n
+        self._count = np.zeros(len(pairs), dtype=np.int64)
+
+        # Edges enter in order of their last post and leave in order of
+        # their first.
+        self._entry_order = np.argsort(self._last, kind='mergesort')
+        self._entry_times = self._last[self._entry_order]
+        self._expiry_order = np.argsort(self._first, kind='mergesort')
+        self._expiry_times = self._first[self._expiry_order]
+        self._entered = 0
+        self._expired = 0
+
+        if start is not None:
+            first_start = edge_cache.to_time(start)
+        elif len(self._first):
+            first_start = self._first.min() - 1
+        else:
+            first_start = 0
+        if end is not None:
+            self._stop = edge_cache.to_time(end)
+        elif len(self._last):
+            self._stop = self._last.max()
+        else:
+            self._stop = first_start
+        self._next_start = first_start
+        self._start = None
+        self._end = None
+
+        self.outdeg = np.zeros(n, dtype=np.int64)
+        self.indeg = np.zeros(n, dtype=np.int64)
+        self._pagerank = None
+        self._pagerank_stale = True
+
+    @property
+    def start(self):
+        return None if self._start is None else np.datetime64(int(self._start), 'us')
+
+    @property
+    def end(self):
+        return None if self._end is None else np.datetime64(int(self._end), 'us')
+
+    def __iter__(self):
+        while self._next_start < self._stop:
+            self.advance()
+            yield self
+
+    def advance(self):
+        """
+        Moves the window to its next position, adding the edges
+        that entered it and dropping the ones that aged out.
+        """
+        start = self._next_start
+        end = start + self.window
+        previous_end = self._end
+
+        entered = np.searchsorted(self._entry_times, end, side='left')
+        entering = self._entry_order[self._entered:entered]
+        # Edges whose first post is already behind the window never
+        # become live.
+        entering = entering[self._first[entering] > start]
+        self._entered = entered
+
+        expired = np.searchsorted(self._expiry_times, start, side='right')
+        expiring = self._expiry_order[self._expired:expired]
+        # Only edges that were live in the previous window can leave.
+        if previous_end is None:
+            expiring = expiring[:0]
+        else:
+            expiring = expiring[self._last[expiring] < previous_end]
+        self._expired = expired
+
+        self._update(entering, 1)
+        self._update(expiring, -1)
+        self._start = start
+        self._end = end
+        self._next_start = start + self.step
+
+    def _update(self, edges, sign):
+        if len(edges) == 0:
+            return
+        pairs, counts = np.unique(self._pair[edges], return_counts=True)
+        before = self._count[pairs] > 0
+        self._count[pairs] += sign * counts
+        after = self._count[pairs] > 0
+        changed = pairs[before != after]
+        if len(changed) == 0:
+            return
+        # Pairs that appeared add one to their endpoints' degrees and
+        # pairs that vanished subtract one.
+        delta = sign * np.ones(len(changed), dtype=np.int64)
+        np.add.at(self.outdeg, self._pair_src[changed], delta)
+        np.add.at(self.indeg, self._pair_dst[changed], delta)
+        self._pagerank_stale = True
+
+    def live_pairs(self):
+        """
+        Returns (src, dst) arrays of dense user indices for the
+        distinct edges in the current window.
+        """
+        live = np.flatnonzero(self._count > 0)
+        return self._pair_src[live], self._pair_dst[live]
+
+    def pagerank(self):
+        """
+        Returns the PageRank of every user in the current window as
+        an array aligned with the UserIndex. Mass lost at users
+        without out-edges is spread evenly over all users, as SNAP's
+        GetPageRank does. Power iteration starts from the previous
+        window's scores.
+        """
+        if not self._pagerank_stale:
+            return self._pagerank
+        n = len(self.index)
+        src, dst = self.live_pairs()
+        rank = self._pagerank
+        if rank is None:
+            rank = np.ones(n) / max(n, 1)
+        rank = graph2._power_iteration(src, dst, n, n, rank, self.damping, self.tolerance, self.max_iter)
+        self._pagerank = rank
+        self._pagerank_stale = False
+        return rank
+
+    def graph(self):
+        """
+        Returns the current window as a SNAP TNGraph over user ids.
+        """
+        graph = snap.TNGraph.New()
+        for user_id in self.index.ids.tolist():
+            graph.AddNode(user_id)
+        src, dst = self.live_pairs()
+        ids = self.index.ids
+        for s, d in zip(ids[src].tolist(), ids[dst].tolist()):
+            graph.AddEdge(s, d)
+        return graph
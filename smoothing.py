@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Moving averages over rating histories, as returned by
+elo.elo_history and cau.cau_history (lists of (rating, time)).
+
+A history is converted to numpy time and rating arrays once, and
+every window is then computed from cumulative sums, so smoothing
+costs O(n) per history regardless of the window size. Many users
+can be smoothed in one batch with smooth_histories.
+"""
+
+from __future__ import division
+import numpy as np
+
+def history_arrays(history):
+    """
+    Returns (times, ratings) arrays for a rating history. Times
+    are seconds since the epoch.
+
+    :param history: list of (rating, datetime) tuples
+    """
+    if len(history) == 0:
+        return np.zeros(0), np.zeros(0)
+    ratings, times = zip(*history)
+    times = np.array(times, dtype='datetime64[us]').astype(np.int64) / 1e6
+    return times, np.asarray(ratings, dtype=np.float64)
+
+def rolling_mean(values, window):
+    """
+    Returns the mean of every run of |window| consecutive values,
+    i.e. len(values) - window + 1 means.
+
+    :param values: 1-d array
+    :param window: number of values per mean
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if window <= 0 or len(values) < window:
+        return np.zeros(0)
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    return (sums[window:] - sums[:-window]) / window
+
+def time_window_mean(times, values, seconds):
+    """
+    Returns, for every entry, the mean of the values recorded in
+    the |seconds| up to and including it.
+
+    :param times: sorted 1-d array of times in seconds
+    :param values: 1-d array aligned with times
+    :param seconds: length of the trailing window
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.searchsorted(times, times - seconds, side='left')
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+def smooth_history(history, window = 8):
+    """
+    Returns (x, y) arrays of the moving average of a history over
+    |window| entries. Histories no longer than the window are
+    returned unsmoothed.
+
+    :param history: list of (rating, datetime) tuples
+    :param window: number of entries per average
+    """
+    times, ratings = history_arrays(history)
+    if len(ratings) <= window:
+        return times, ratings
+    # Shift times to start at zero so the cumulative sum stays precise.
+    return rolling_mean(times - times[0], window) + times[0], rolling_mean(ratings, window)
+
+def smooth_histories(histories, window = 8):
+    """
+    Same as smooth_history for many histories at once. All of
+    them are concatenated and smoothed with a single cumulative
+    sum; windows straddling two histories are dropped.
+
+    :param histories: list of rating histories
+    :param window: number of entries per average
+
+    Returns a list of (x, y) arrays, one per history.
+    """
+    arrays = [history_arrays(history) for history in histories]
+    lengths = np.array([len(ratings) for times, ratings in arrays], dtype=np.int64)
+    if lengths.sum() == 0:
+        return arrays
+
+    times = np.concatenate([t for t, r in arrays])
+    ratings = np.concatenate([r for t, r in arrays])
+    origin = times.min()
+    x = rolling_mean(times - origin, window) + origin
+    y = rolling_mean(ratings, window)
+
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    result = []
+    for (t, r), start, length in zip(arrays, starts, lengths):
+        if length <= window:
+            result.append((t, r))
+        else:
+            # Windows starting at start .. start + length - window lie
+            # entirely inside this history.
+            result.append((x[start:start + length - window + 1],
+                           y[start:start + length - window + 1]))
+    return result
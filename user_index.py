@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Maps sparse Stack Exchange user ids onto dense indices 0..n-1 so
+per-user state (ranks, ratings, features) can live in flat numpy
+arrays instead of dicts keyed by user id. The mapping is built once
+per dataset and persisted under the cache directory, and rebuilt
+when the dataset version stamp changes.
+"""
+
+import numpy as np
+import cache_utilities
+
+INDEX_FILE = "user_index.pkl"
+
+class UserIndex(object):
+    """
+    A sorted array of user ids. The dense index of a user is its
+    position in that array.
+    """
+
+    def __init__(self, ids):
+        self.ids = np.unique(np.asarray(ids, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, user_id):
+        i = np.searchsorted(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def index(self, user_id):
+        """
+        Returns the dense index of a single user.
+
+        :param user_id: the user id
+        """
+        i = np.searchsorted(self.ids, user_id)
+        if i == len(self.ids) or self.ids[i] != user_id:
+            raise KeyError(user_id)
+        return int(i)
+
+    def indices(self, user_ids, missing = -1):
+        """
+        Returns an array with the dense index of each user id.
+        Ids that are not in the index map to |missing|.
+
+        :param user_ids: a sequence of user ids
+        :param missing: value used for unknown ids
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(user_ids.shape, missing, dtype=np.int64)
+        found = np.searchsorted(self.ids, user_ids)
+        found = np.minimum(found, len(self.ids) - 1)
+        return np.where(self.ids[found] == user_ids, found, missing)
+
+    def to_array(self, scores, default = 0.0, dtype = np.float64):
+        """
+        Converts a dict of {user_id: value}, like the ones returned
+        by graph2.pagerank or graph2.indegree, into a dense array.
+        Users absent from the dict get |default|.
+
+        :param scores: dict keyed by user id
+        :param default: value for users without a score
+        """
+        values = np.empty(len(self.ids), dtype=dtype)
+        values.fill(default)
+        if scores:
+            keys = np.fromiter(scores.iterkeys(), dtype=np.int64, count=len(scores))
+            vals = np.fromiter(scores.itervalues(), dtype=dtype, count=len(scores))
+            rows = self.indices(keys)
+            known = rows >= 0
+            values[rows[known]] = vals[known]
+        return values
+
+    def to_dict(self, values):
+        """
+        Converts a dense array back into a dict keyed by user id.
+
+        :param values: array aligned with this index
+        """
+        return dict(zip(self.ids.tolist(), np.asarray(values).tolist()))
+
+    def mask(self, user_ids):
+        """
+        Returns a boolean array that is true for the given users.
+
+        :param user_ids: a sequence of user ids
+        """
+        selected = np.zeros(len(self.ids), dtype=bool)
+        rows = self.indices(user_ids)
+        selected[rows[rows >= 0]] = True
+        return selected
+
+def build_user_index(cursor):
+    """
+    Builds a UserIndex over every non-dummy user in se_user.
+
+    :param cursor: a Postgres database cursor
+    """
+    cursor.execute("SELECT id FROM se_user WHERE id >= 0;")
+    return UserIndex([result[0] for result in cursor])
+
+def user_index(cursor, conn, rebuild = False):
+    """
+    Returns the UserIndex for the dataset behind |conn|, loading it
+    from the cache directory unless it is missing, out of date or
+    |rebuild| is set.
+
+    :param cursor: a Postgres database cursor
+    :param conn: the connection |cursor| belongs to
+    :param rebuild: ignore any cached index and rebuild it
+    """
+    return cache_utilities.cached(cache_utilities.dataset_name(conn), INDEX_FILE,
+                                  cache_utilities.dataset_version(cursor),
+                                  lambda: build_user_index(cursor), rebuild)
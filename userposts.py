@@ -5,10 +5,13 @@ from collections import Counter
 import psycopg2
 import matplotlib.pyplot as plt
 import numpy as np
+import cache_utilities
 
 DB_NAME = "stackexchangedb"
 DB_USER = "postgres"
 
+DISTRIBUTION_FILE = "posts_distribution.pkl"
+
 def connect(db=DB_NAME, user=DB_USER):
     """Connect to the specified Postgres database as the specified user."""
     conn = psycopg2.connect("dbname={} user={}".format(db, user))
@@ -24,29 +27,48 @@ def results(cursor):
         yield result
 
 def get_posts_distribution(cur):
-    query1 = "select id from se_user where id <> -1"
-    cur.execute(query1)
-    users = [i[0] for i in results(cur)]
-    distribution_questions = Counter()
-    distribution_answers = Counter()
-    for user in users:
-        query2 = "select count(*) from post where owner_user_id = %(id)s and post_type_id = 1"
-        cur.execute(query2, {'id': user})
-        num = int([i[0] for i in results(cur)][0])
-        distribution_questions[num] += 1
-        query3 = "select count(*) from post where owner_user_id = %(id)s and post_type_id = 2"
-        cur.execute(query3, {'id': user})
-        num = int([i[0] for i in results(cur)][0])
-        distribution_answers[num] += 1
-    return (distribution_questions, distribution_answers)
-
-
-
-        
+    """Histograms of questions and answers per user, as Counters mapping a
+       post count to the number of users with that many posts. Computed
+       from a single GROUP BY scan of post; users without posts count as 0."""
+    query = """SELECT p.owner_user_id, p.post_type_id, COUNT(*)
+               FROM post p
+               INNER JOIN se_user u
+               ON u.id = p.owner_user_id
+               WHERE p.owner_user_id <> -1
+               AND p.post_type_id IN (1, 2)
+               GROUP BY p.owner_user_id, p.post_type_id;
+            """
+    cur.execute(query)
+    rows = cur.fetchall()
+    cur.execute("select count(*) from se_user where id <> -1")
+    num_users = cur.fetchone()[0]
+    return fold_distribution(rows, num_users)
+
+def fold_distribution(rows, num_users):
+    """Folds (user, post type, count) rows into question and answer
+       histograms. Users missing from the rows are counted as having 0."""
+    counts = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    distributions = []
+    for post_type in (1, 2):
+        per_user = counts[counts[:, 1] == post_type, 2]
+        values, users = np.unique(per_user, return_counts=True)
+        distribution = Counter(dict(zip(values.tolist(), users.tolist())))
+        inactive = num_users - len(per_user)
+        if inactive > 0:
+            distribution[0] += inactive
+        distributions.append(distribution)
+    return tuple(distributions)
+
+def cached_posts_distribution(cur, conn):
+    """get_posts_distribution, cached per dataset and recomputed only when
+       the dataset version stamp changes."""
+    return cache_utilities.cached(cache_utilities.dataset_name(conn), DISTRIBUTION_FILE,
+                                  cache_utilities.dataset_version(cur),
+                                  lambda: get_posts_distribution(cur))
 
 def main():
     conn, cur = connect()
-    questions, answers = get_posts_distribution(cur)
+    questions, answers = cached_posts_distribution(cur, conn)
     print questions
     print answers
 